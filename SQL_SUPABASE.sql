@@ -1,10 +1,19 @@
 -- Ejecuta todo este bloque en Supabase → SQL Editor
 
+create table if not exists public.products (
+  id bigserial primary key,
+  name text not null,
+  price numeric(10,2) not null default 0,
+  stock integer not null default 0,
+  created_at timestamptz default now()
+);
 alter table public.products
   add column if not exists image_path text,
   add column if not exists slug text,
   add column if not exists description text,
-  add column if not exists active boolean default true;
+  add column if not exists active boolean default true,
+  add column if not exists image_version bigint,
+  add column if not exists image_variants boolean default false;
 create unique index if not exists products_slug_uindex on public.products(slug);
 
 create table if not exists public.categories (
@@ -73,6 +82,28 @@ create table if not exists public.order_items (
   subtotal numeric(10,2)
 );
 
+-- Índices para los filtros de cada consulta de la app (bench/explain.py lo verifica con EXPLAIN)
+-- Antes del índice único se fusionan las líneas repetidas de un mismo producto en el carrito.
+with dups as (
+  select min(id) as keep_id, cart_id, product_id, sum(qty) as qty
+  from public.cart_items group by cart_id, product_id having count(*) > 1
+), merged as (
+  update public.cart_items ci set qty = d.qty from dups d where ci.id = d.keep_id
+  returning ci.id
+)
+delete from public.cart_items ci using dups d
+where ci.cart_id = d.cart_id and ci.product_id = d.product_id and ci.id <> d.keep_id;
+create unique index if not exists cart_items_cart_product_uindex on public.cart_items(cart_id, product_id);
+create index if not exists cart_items_product_idx on public.cart_items(product_id);
+create index if not exists orders_user_id_idx on public.orders(user_id, id desc);
+create index if not exists orders_created_at_idx on public.orders(created_at);
+create index if not exists order_items_order_idx on public.order_items(order_id);
+create index if not exists order_items_product_idx on public.order_items(product_id);
+create index if not exists addresses_user_idx on public.addresses(user_id, created_at);
+create index if not exists product_categories_category_idx on public.product_categories(category_id, product_id);
+-- Catálogo: keyset por (name, id) solo sobre productos activos.
+create index if not exists products_active_name_idx on public.products(name, id) where active;
+
 select case when not exists (select 1 from storage.buckets where id='products')
   then storage.create_bucket('products', public:=true)
   else null end;
@@ -80,7 +111,7 @@ select case when not exists (select 1 from storage.buckets where id='products')
 alter table storage.objects enable row level security;
 do $$
 begin
-  if not exists (select 1 from pg_policies where polname='public_read_products') then
+  if not exists (select 1 from pg_policies where policyname='public_read_products') then
     create policy public_read_products
     on storage.objects for select to anon, authenticated using (bucket_id = 'products');
   end if;
@@ -95,26 +126,507 @@ alter table public.orders enable row level security;
 alter table public.order_items enable row level security;
 alter table public.addresses enable row level security;
 
-create policy if not exists products_read_public on public.products for select to anon, authenticated using (true);
-create policy if not exists categories_read_public on public.categories for select to anon, authenticated using (true);
-create policy if not exists product_categories_read_public on public.product_categories for select to anon, authenticated using (true);
-
-create policy if not exists products_write_admin on public.products for all to authenticated
-  using (exists (select 1 from public.admins a where a.user_id = auth.uid()))
-  with check (exists (select 1 from public.admins a where a.user_id = auth.uid()));
-create policy if not exists categories_write_admin on public.categories for all to authenticated
-  using (exists (select 1 from public.admins a where a.user_id = auth.uid()))
-  with check (exists (select 1 from public.admins a where a.user_id = auth.uid()));
-create policy if not exists product_categories_write_admin on public.product_categories for all to authenticated
-  using (exists (select 1 from public.admins a where a.user_id = auth.uid()))
-  with check (exists (select 1 from public.admins a where a.user_id = auth.uid()));
-
-create policy if not exists carts_self on public.carts for all to authenticated
-  using (user_id = auth.uid()) with check (user_id = auth.uid());
-create policy if not exists cart_items_self on public.cart_items for all to authenticated
-  using (exists(select 1 from public.carts c where c.id=cart_id and c.user_id=auth.uid()))
-  with check (exists(select 1 from public.carts c where c.id=cart_id and c.user_id=auth.uid()));
-create policy if not exists addresses_self on public.addresses for all to authenticated
-  using (user_id = auth.uid()) with check (user_id = auth.uid());
-create policy if not exists orders_self on public.orders for select to authenticated
-  using (user_id = auth.uid());
+-- (select auth.uid()) se evalúa una vez por consulta y no una vez por fila.
+drop policy if exists products_read_public on public.products;
+create policy products_read_public on public.products for select to anon, authenticated using (true);
+drop policy if exists categories_read_public on public.categories;
+create policy categories_read_public on public.categories for select to anon, authenticated using (true);
+drop policy if exists product_categories_read_public on public.product_categories;
+create policy product_categories_read_public on public.product_categories for select to anon, authenticated using (true);
+
+drop policy if exists products_write_admin on public.products;
+create policy products_write_admin on public.products for all to authenticated
+  using (exists (select 1 from public.admins a where a.user_id = (select auth.uid())))
+  with check (exists (select 1 from public.admins a where a.user_id = (select auth.uid())));
+drop policy if exists categories_write_admin on public.categories;
+create policy categories_write_admin on public.categories for all to authenticated
+  using (exists (select 1 from public.admins a where a.user_id = (select auth.uid())))
+  with check (exists (select 1 from public.admins a where a.user_id = (select auth.uid())));
+drop policy if exists product_categories_write_admin on public.product_categories;
+create policy product_categories_write_admin on public.product_categories for all to authenticated
+  using (exists (select 1 from public.admins a where a.user_id = (select auth.uid())))
+  with check (exists (select 1 from public.admins a where a.user_id = (select auth.uid())));
+
+drop policy if exists carts_self on public.carts;
+create policy carts_self on public.carts for all to authenticated
+  using (user_id = (select auth.uid())) with check (user_id = (select auth.uid()));
+drop policy if exists cart_items_self on public.cart_items;
+create policy cart_items_self on public.cart_items for all to authenticated
+  using (cart_id in (select c.id from public.carts c where c.user_id = (select auth.uid())))
+  with check (cart_id in (select c.id from public.carts c where c.user_id = (select auth.uid())));
+drop policy if exists addresses_self on public.addresses;
+create policy addresses_self on public.addresses for all to authenticated
+  using (user_id = (select auth.uid())) with check (user_id = (select auth.uid()));
+drop policy if exists orders_self on public.orders;
+create policy orders_self on public.orders for select to authenticated
+  using (user_id = (select auth.uid()));
+
+-- Versión del catálogo para los ETag de las páginas anónimas: la suben los
+-- cambios de productos, categorías y sus relaciones, una vez por sentencia.
+-- Las ventas solo tocan products.stock y no la suben: así el checkout no se
+-- serializa sobre esta fila (las existencias de la grilla se refrescan con la
+-- caché de datos y cambian el ETag porque cambia el HTML).
+create table if not exists public.catalog_version (
+  id boolean primary key default true check (id),
+  version bigint not null default 0,
+  updated_at timestamptz not null default now()
+);
+insert into public.catalog_version (id) values (true) on conflict (id) do nothing;
+alter table public.catalog_version enable row level security;
+drop policy if exists catalog_version_read_public on public.catalog_version;
+create policy catalog_version_read_public on public.catalog_version for select to anon, authenticated using (true);
+
+create or replace function public.bump_catalog_version()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  update public.catalog_version set version = version + 1, updated_at = now() where id;
+  return null;
+end $$;
+
+do $$
+begin
+  if not exists (select 1 from pg_trigger where tgname = 'products_catalog_version') then
+    create trigger products_catalog_version
+      after insert or delete or update of name, slug, price, description, active, image_path, image_version, image_variants on public.products
+      for each statement execute function public.bump_catalog_version();
+  end if;
+  if not exists (select 1 from pg_trigger where tgname = 'categories_catalog_version') then
+    create trigger categories_catalog_version
+      after insert or update or delete on public.categories
+      for each statement execute function public.bump_catalog_version();
+  end if;
+  if not exists (select 1 from pg_trigger where tgname = 'product_categories_catalog_version') then
+    create trigger product_categories_catalog_version
+      after insert or update or delete on public.product_categories
+      for each statement execute function public.bump_catalog_version();
+  end if;
+end $$;
+
+-- Búsqueda de texto completo (SEARCH_BACKEND=postgres)
+create extension if not exists unaccent;
+do $$
+begin
+  if not exists (select 1 from pg_ts_config where cfgname = 'es_unaccent') then
+    create text search configuration public.es_unaccent (copy = pg_catalog.spanish);
+    alter text search configuration public.es_unaccent
+      alter mapping for hword, hword_part, word with unaccent, spanish_stem;
+  end if;
+end $$;
+
+alter table public.products
+  add column if not exists search_tsv tsvector generated always as (
+    setweight(to_tsvector('public.es_unaccent', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('public.es_unaccent', coalesce(description, '')), 'B')
+  ) stored;
+create index if not exists products_search_tsv_idx on public.products using gin (search_tsv);
+
+create or replace function public.search_products(q text, category_slug text default null, lim int default 24, off int default 0)
+returns jsonb
+language sql stable
+as $$
+  with tsq as (
+    select to_tsquery('public.es_unaccent', string_agg(quote_literal(t) || ':*', ' & ')) as query
+    from regexp_split_to_table(lower(trim(q)), '[^[:alnum:]]+') as t
+    where t <> ''
+  ),
+  hits as (
+    select p.id, p.name, p.slug, p.price, p.stock, p.image_path, p.image_version, p.image_variants, p.active,
+           ts_rank_cd(p.search_tsv, tsq.query) as rank
+    from public.products p, tsq
+    where coalesce(p.active, true)
+      and p.search_tsv @@ tsq.query
+      and (category_slug is null or exists (
+        select 1 from public.product_categories pc
+        join public.categories c on c.id = pc.category_id
+        where pc.product_id = p.id and c.slug = category_slug))
+  )
+  select jsonb_build_object(
+    'total', (select count(*) from hits),
+    'items', coalesce((
+      select jsonb_agg(to_jsonb(h) - 'rank' order by h.rank desc, h.name)
+      from (select * from hits order by rank desc, name limit lim offset off) h
+    ), '[]'::jsonb)
+  );
+$$;
+
+-- Creación atómica de la orden y sus artículos en una sola llamada
+create or replace function public.create_order_with_items(
+  p_user_id uuid, p_total numeric, p_currency text, p_payment_method text, p_address jsonb, p_items jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_order public.orders;
+begin
+  insert into public.orders (user_id, status, total, currency, payment_method, payment_status, address_snapshot)
+  values (p_user_id, 'pending', p_total, p_currency, p_payment_method, 'unpaid', p_address)
+  returning * into v_order;
+
+  insert into public.order_items (order_id, product_id, name, price, qty, subtotal)
+  select v_order.id, (i->>'product_id')::bigint, i->>'name', (i->>'price')::numeric, (i->>'qty')::int, (i->>'subtotal')::numeric
+  from jsonb_array_elements(p_items) as i;
+
+  perform public.release_expired_reservations();
+  perform public.reserve_stock(v_order.id, p_items);
+
+  return to_jsonb(v_order);
+end $$;
+revoke execute on function public.create_order_with_items(uuid, numeric, text, text, jsonb, jsonb) from public, anon, authenticated;
+
+-- Carrito con productos y total calculado en el servidor (una sola llamada)
+create or replace function public.cart_with_products(p_user_id uuid)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_cart_id uuid;
+  v_result jsonb;
+begin
+  insert into public.carts (user_id) values (p_user_id) on conflict (user_id) do nothing;
+  select id into v_cart_id from public.carts where user_id = p_user_id;
+
+  with lines as (
+    select ci.id, ci.product_id, ci.qty, ci.price_at_add,
+           round(coalesce(p.price, ci.price_at_add, 0), 2) as price,
+           round(coalesce(p.price, ci.price_at_add, 0) * coalesce(ci.qty, 1), 2) as subtotal,
+           jsonb_build_object('id', p.id, 'name', p.name, 'slug', p.slug, 'price', p.price, 'stock', p.stock,
+                              'image_path', p.image_path, 'image_version', p.image_version,
+                              'image_variants', p.image_variants) as product
+    from public.cart_items ci
+    left join public.products p on p.id = ci.product_id
+    where ci.cart_id = v_cart_id
+  )
+  select jsonb_build_object(
+    'cart_id', v_cart_id,
+    'items', coalesce(jsonb_agg(to_jsonb(l) order by l.id), '[]'::jsonb),
+    'total', coalesce(sum(l.subtotal), 0)
+  ) into v_result
+  from lines l;
+
+  return v_result;
+end $$;
+revoke execute on function public.cart_with_products(uuid) from public, anon, authenticated;
+
+-- Fusiona el carrito de invitado (guardado en la sesión) al iniciar sesión:
+-- un solo upsert sobre cart_items_cart_product_uindex suma las cantidades.
+create or replace function public.merge_guest_cart(p_user_id uuid, p_items jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+  v_cart_id uuid;
+begin
+  insert into public.carts (user_id) values (p_user_id) on conflict (user_id) do nothing;
+  select id into v_cart_id from public.carts where user_id = p_user_id;
+
+  insert into public.cart_items (cart_id, product_id, qty, price_at_add)
+  select v_cart_id, p.id, sum(i.qty), p.price
+  from jsonb_to_recordset(p_items) as i(product_id bigint, qty integer)
+  join public.products p on p.id = i.product_id and p.active
+  where i.qty > 0
+  group by p.id, p.price
+  on conflict (cart_id, product_id) do update set qty = public.cart_items.qty + excluded.qty;
+
+  return jsonb_build_object(
+    'cart_id', v_cart_id,
+    'count', (select count(*) from public.cart_items where cart_id = v_cart_id)
+  );
+end $$;
+revoke execute on function public.merge_guest_cart(uuid, jsonb) from public, anon, authenticated;
+
+-- Reservas de inventario: se descuentan al crear la orden, se confirman con el
+-- pago y se devuelven si el pago falla o la reserva expira.
+create table if not exists public.stock_reservations (
+  id bigserial primary key,
+  order_id bigint not null references public.orders(id) on delete cascade,
+  product_id bigint not null references public.products(id) on delete cascade,
+  qty integer not null check (qty > 0),
+  status text not null default 'held' check (status in ('held', 'committed', 'released')),
+  expires_at timestamptz not null,
+  created_at timestamptz default now()
+);
+create index if not exists stock_reservations_order_idx on public.stock_reservations(order_id);
+create index if not exists stock_reservations_expiry_idx on public.stock_reservations(expires_at) where status = 'held';
+alter table public.stock_reservations enable row level security;
+
+create or replace function public.reserve_stock(p_order_id bigint, p_items jsonb, p_ttl interval default '30 minutes')
+returns void
+language plpgsql
+as $$
+declare
+  r record;
+begin
+  -- Orden fijo por producto para que checkouts concurrentes no se bloqueen mutuamente.
+  for r in
+    select (i->>'product_id')::bigint as product_id, sum((i->>'qty')::int) as qty
+    from jsonb_array_elements(p_items) as i
+    group by 1
+    order by 1
+  loop
+    update public.products set stock = stock - r.qty
+    where id = r.product_id and stock >= r.qty;
+    if not found then
+      raise exception 'insufficient_stock:%', r.product_id using errcode = 'P0001';
+    end if;
+    insert into public.stock_reservations (order_id, product_id, qty, expires_at)
+    values (p_order_id, r.product_id, r.qty, now() + p_ttl);
+  end loop;
+end $$;
+
+create or replace function public.release_stock(p_order_id bigint)
+returns integer
+language plpgsql
+as $$
+declare
+  v_count integer;
+begin
+  with released as (
+    update public.stock_reservations set status = 'released'
+    where order_id = p_order_id and status = 'held'
+    returning product_id, qty
+  ), totals as (
+    select product_id, sum(qty) as qty from released group by product_id
+  )
+  update public.products p set stock = p.stock + t.qty
+  from totals t where p.id = t.product_id;
+  get diagnostics v_count = row_count;
+  return v_count;
+end $$;
+
+create or replace function public.release_expired_reservations()
+returns integer
+language plpgsql
+as $$
+declare
+  v_count integer;
+begin
+  with released as (
+    update public.stock_reservations set status = 'released'
+    where status = 'held' and expires_at < now()
+    returning product_id, qty
+  ), totals as (
+    select product_id, sum(qty) as qty from released group by product_id
+  )
+  update public.products p set stock = p.stock + t.qty
+  from totals t where p.id = t.product_id;
+  get diagnostics v_count = row_count;
+  return v_count;
+end $$;
+
+-- Devuelve cuántas reservas no se pudieron confirmar por falta de stock; la app
+-- marca esas órdenes en otra sentencia. Actualizar orders aquí, con el producto
+-- bloqueado, se cruza con los checkouts (contadores de track_order_metrics y
+-- luego el producto) y produce deadlocks.
+create or replace function public.commit_stock(p_order_id bigint)
+returns integer
+language plpgsql
+as $$
+declare
+  r record;
+  v_short integer := 0;
+begin
+  update public.stock_reservations set status = 'committed'
+  where order_id = p_order_id and status = 'held';
+
+  -- Si la reserva ya había expirado, el pago confirmado vuelve a descontar las
+  -- unidades, pero con la misma guarda que reserve_stock: nunca queda stock negativo.
+  for r in
+    select id, product_id, qty from public.stock_reservations
+    where order_id = p_order_id and status = 'released'
+    order by product_id
+    for update
+  loop
+    update public.products set stock = stock - r.qty
+    where id = r.product_id and stock >= r.qty;
+    if found then
+      update public.stock_reservations set status = 'committed' where id = r.id;
+    else
+      v_short := v_short + 1;
+    end if;
+  end loop;
+  return v_short;
+end $$;
+
+revoke execute on function public.reserve_stock(bigint, jsonb, interval) from public, anon, authenticated;
+revoke execute on function public.release_stock(bigint) from public, anon, authenticated;
+revoke execute on function public.release_expired_reservations() from public, anon, authenticated;
+revoke execute on function public.commit_stock(bigint) from public, anon, authenticated;
+-- Opcional con pg_cron:
+-- select cron.schedule('release-expired-stock', '*/5 * * * *', 'select public.release_expired_reservations()');
+
+-- Métricas del panel: contadores y agregados mantenidos por triggers, y una
+-- vista materializada de productos más vendidos refrescada periódicamente.
+create table if not exists public.store_counters (
+  name text primary key,
+  value bigint not null default 0
+);
+create table if not exists public.order_status_counts (
+  status text not null,
+  payment_status text not null,
+  orders bigint not null default 0,
+  primary key (status, payment_status)
+);
+create table if not exists public.revenue_daily (
+  day date primary key,
+  orders bigint not null default 0,
+  revenue numeric(14,2) not null default 0
+);
+create table if not exists public.metrics_refreshes (
+  name text primary key,
+  refreshed_at timestamptz not null default now()
+);
+alter table public.store_counters enable row level security;
+alter table public.order_status_counts enable row level security;
+alter table public.revenue_daily enable row level security;
+alter table public.metrics_refreshes enable row level security;
+
+-- Los triggers escriben en tablas con RLS y sin políticas: corren como el dueño
+-- de la función, no como el rol (anon/authenticated) que modificó la fila.
+create or replace function public.count_rows()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if TG_OP = 'INSERT' then
+    insert into public.store_counters (name, value) select TG_TABLE_NAME, count(*) from inserted
+    on conflict (name) do update set value = public.store_counters.value + excluded.value;
+  else
+    update public.store_counters set value = value - (select count(*) from deleted) where name = TG_TABLE_NAME;
+  end if;
+  return null;
+end $$;
+
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['products', 'categories', 'orders'] loop
+    if not exists (select 1 from pg_trigger where tgname = t || '_count_insert') then
+      execute format('create trigger %I after insert on public.%I referencing new table as inserted for each statement execute function public.count_rows()', t || '_count_insert', t);
+    end if;
+    if not exists (select 1 from pg_trigger where tgname = t || '_count_delete') then
+      execute format('create trigger %I after delete on public.%I referencing old table as deleted for each statement execute function public.count_rows()', t || '_count_delete', t);
+    end if;
+  end loop;
+end $$;
+
+create or replace function public.track_order_metrics()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if TG_OP in ('UPDATE', 'DELETE') then
+    update public.order_status_counts set orders = orders - 1
+    where status = old.status and payment_status = coalesce(old.payment_status, '');
+    if old.payment_status = 'paid' then
+      update public.revenue_daily set orders = orders - 1, revenue = revenue - old.total
+      where day = (old.created_at at time zone 'America/Guatemala')::date;
+    end if;
+  end if;
+  if TG_OP in ('INSERT', 'UPDATE') then
+    insert into public.order_status_counts (status, payment_status, orders)
+    values (new.status, coalesce(new.payment_status, ''), 1)
+    on conflict (status, payment_status) do update set orders = public.order_status_counts.orders + 1;
+    if new.payment_status = 'paid' then
+      insert into public.revenue_daily (day, orders, revenue)
+      values ((new.created_at at time zone 'America/Guatemala')::date, 1, new.total)
+      on conflict (day) do update set orders = public.revenue_daily.orders + 1,
+                                      revenue = public.revenue_daily.revenue + excluded.revenue;
+    end if;
+  end if;
+  return null;
+end $$;
+
+do $$
+begin
+  if not exists (select 1 from pg_trigger where tgname = 'orders_metrics') then
+    create trigger orders_metrics
+      after insert or delete or update of status, payment_status, total on public.orders
+      for each row execute function public.track_order_metrics();
+  end if;
+end $$;
+
+create materialized view if not exists public.top_products_mv as
+  select oi.product_id, max(oi.name) as name, sum(oi.qty)::bigint as units, sum(oi.subtotal) as revenue
+  from public.order_items oi
+  join public.orders o on o.id = oi.order_id
+  where o.payment_status = 'paid'
+  group by oi.product_id;
+create unique index if not exists top_products_mv_product_idx on public.top_products_mv(product_id);
+revoke all on public.top_products_mv from anon, authenticated;
+
+-- Recalcula todo desde cero (idempotente; se puede volver a ejecutar).
+insert into public.store_counters (name, value)
+  select 'products', count(*) from public.products
+  union all select 'categories', count(*) from public.categories
+  union all select 'orders', count(*) from public.orders
+on conflict (name) do update set value = excluded.value;
+truncate public.order_status_counts, public.revenue_daily;
+insert into public.order_status_counts (status, payment_status, orders)
+  select status, coalesce(payment_status, ''), count(*) from public.orders group by 1, 2;
+insert into public.revenue_daily (day, orders, revenue)
+  select (created_at at time zone 'America/Guatemala')::date, count(*), sum(total)
+  from public.orders where payment_status = 'paid' group by 1;
+refresh materialized view public.top_products_mv;
+insert into public.metrics_refreshes (name) values ('top_products_mv')
+on conflict (name) do update set refreshed_at = now();
+
+-- Refresca top_products_mv si tiene más de p_max_age. La llaman pg_cron y el
+-- panel admin cuando la ve vieja; el advisory lock evita que varios workers
+-- la refresquen a la vez. Devuelve si refrescó.
+drop function if exists public.refresh_dashboard_metrics();
+create or replace function public.refresh_dashboard_metrics(p_max_age interval default '0 seconds')
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if not pg_try_advisory_xact_lock(hashtext('top_products_mv')) then
+    return false;
+  end if;
+  if exists (select 1 from public.metrics_refreshes
+             where name = 'top_products_mv' and refreshed_at > now() - p_max_age) then
+    return false;
+  end if;
+  refresh materialized view concurrently public.top_products_mv;
+  insert into public.metrics_refreshes (name) values ('top_products_mv')
+  on conflict (name) do update set refreshed_at = now();
+  return true;
+end $$;
+
+create or replace function public.dashboard_metrics()
+returns jsonb
+language sql stable
+as $$
+  select jsonb_build_object(
+    'counts', (select coalesce(jsonb_object_agg(name, value), '{}'::jsonb) from public.store_counters),
+    'by_status', (select coalesce(jsonb_agg(to_jsonb(s) order by s.orders desc), '[]'::jsonb)
+                  from public.order_status_counts s where s.orders > 0),
+    'revenue_daily', (select coalesce(jsonb_agg(to_jsonb(r) order by r.day desc), '[]'::jsonb)
+                      from public.revenue_daily r
+                      where r.day > (now() at time zone 'America/Guatemala')::date - 30),
+    'top_products', (select coalesce(jsonb_agg(to_jsonb(t) order by t.units desc), '[]'::jsonb)
+                     from (select * from public.top_products_mv order by units desc limit 10) t),
+    'top_products_age', (select extract(epoch from now() - refreshed_at)::int
+                         from public.metrics_refreshes where name = 'top_products_mv')
+  );
+$$;
+revoke execute on function public.refresh_dashboard_metrics(interval) from public, anon, authenticated;
+revoke execute on function public.dashboard_metrics() from public, anon, authenticated;
+-- Con pg_cron habilitado (Database → Extensions) se refresca cada 10 minutos;
+-- sin él, lo hace el panel admin al abrirse con la vista vieja (DASHBOARD_REFRESH_INTERVAL).
+do $$
+begin
+  if exists (select 1 from pg_extension where extname = 'pg_cron') then
+    perform cron.schedule('refresh-dashboard-metrics', '*/10 * * * *', 'select public.refresh_dashboard_metrics()');
+  end if;
+end $$;
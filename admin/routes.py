@@ -1,29 +1,83 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from core import db_admin, storage_admin, public_url, admin_required, BUCKET
+import os
+import time
+import logging
+from datetime import date, timedelta
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from core import db_admin, storage_admin, image_set, admin_required, run_parallel, background_pool, admin_cache, admin_auth_stats, revoke_admin, BUCKET
+from cache import catalog_cache, invalidate_products, invalidate_categories
+from search import search_index, invalidate_index
+from pagination import keyset_page, page_size
+from images import schedule_variants
+from ipn import queue_stats
+from exports import iter_orders, flatten, csv_stream, jsonl_stream
+from product_import import run_import
+
+DASHBOARD_REFRESH_INTERVAL = float(os.environ.get("DASHBOARD_REFRESH_INTERVAL", 600))
 
 admin_bp = Blueprint("admin", __name__, template_folder="templates", static_folder="static")
+log = logging.getLogger(__name__)
+_dashboard_refreshing = set()
+
+def _refresh_dashboard():
+    try:
+        db_admin().rpc("refresh_dashboard_metrics", {"p_max_age": f"{int(DASHBOARD_REFRESH_INTERVAL)} seconds"}).execute()
+    except Exception:
+        log.exception("No se pudo refrescar top_products_mv")
+    finally:
+        _dashboard_refreshing.discard("top_products")
 
 @admin_bp.get("/dashboard")
 @admin_required
 def dashboard():
-    prod_count = db_admin().table("products").select("id", count="exact").execute().count or 0
-    cat_count = db_admin().table("categories").select("id", count="exact").execute().count or 0
-    order_count = db_admin().table("orders").select("id", count="exact").execute().count or 0
-    return render_template("admin/dashboard.html", prod_count=prod_count, cat_count=cat_count, order_count=order_count)
+    m = db_admin().rpc("dashboard_metrics").execute().data or {}
+    # Sin pg_cron nadie más refresca los más vendidos: se hace en segundo plano si están viejos.
+    age = m.get("top_products_age")
+    if (age is None or age > DASHBOARD_REFRESH_INTERVAL) and "top_products" not in _dashboard_refreshing:
+        _dashboard_refreshing.add("top_products")
+        background_pool().submit(_refresh_dashboard)
+    counts = m.get("counts") or {}
+    return render_template("admin/dashboard.html",
+                           prod_count=counts.get("products", 0),
+                           cat_count=counts.get("categories", 0),
+                           order_count=counts.get("orders", 0),
+                           by_status=m.get("by_status") or [],
+                           revenue_daily=m.get("revenue_daily") or [],
+                           top_products=m.get("top_products") or [])
+
+@admin_bp.get("/cache")
+@admin_required
+def cache_stats():
+    auth = dict(admin_auth_stats, avoided=admin_auth_stats["cache_hits"] + admin_auth_stats["session_hits"])
+    return jsonify({"catalog": catalog_cache.stats(), "admin_auth": auth, "admin_cache": admin_cache.stats(), "ipn": queue_stats()})
+
+@admin_bp.post("/cache/admins/<user_id>/revoke")
+@admin_required
+def admin_revoke(user_id):
+    revoke_admin(user_id)
+    return jsonify({"revoked": user_id})
+
+def _all_categories():
+    return catalog_cache.get_or_set(("admin_categories",), lambda: db_admin().table("categories").select("id,name,slug").order("name").execute().data or [])
+
+def _load_products(after, before, limit):
+    query = db_admin().table("products").select("id,name,slug,price,stock,image_path,image_version,image_variants,active")
+    page = keyset_page(query, ("name", "id"), after, before, limit)
+    for p in page.items:
+        p.update(image_set(p, "thumb"))
+    return page
 
 @admin_bp.get("/products")
 @admin_required
 def products_list():
-    res = db_admin().table("products").select("id,name,slug,price,stock,image_path,active").order("name").execute()
-    products = res.data or []
-    for p in products:
-        p["image_url"] = public_url(p.get("image_path"))
-    return render_template("admin/products_list.html", products=products)
+    after, before = request.args.get("after"), request.args.get("before")
+    limit = page_size(request.args.get("limit"))
+    page = catalog_cache.get_or_set(("admin_products", after, before, limit), lambda: _load_products(after, before, limit))
+    return render_template("admin/products_list.html", products=page.items, page=page)
 
 @admin_bp.get("/products/new")
 @admin_required
 def products_new():
-    cats = db_admin().table("categories").select("id,name,slug").order("name").execute().data or []
+    cats = _all_categories()
     return render_template("admin/product_form.html", product=None, categories=cats, assigned=[])
 
 @admin_bp.post("/products/new")
@@ -40,22 +94,49 @@ def products_create():
     }
     pr = db_admin().table("products").insert(data).execute().data
     pid = pr[0]["id"]
+    search_index.upsert(pr[0])
     cat_ids = request.form.getlist("categories")
-    for cid in cat_ids:
-        db_admin().table("product_categories").insert({"product_id": pid, "category_id": int(cid)}).execute()
+    if cat_ids:
+        db_admin().table("product_categories").insert([{"product_id": pid, "category_id": int(cid)} for cid in cat_ids]).execute()
+    invalidate_products()
     flash("Producto creado ✅", "success")
     return redirect(url_for("admin.products_list"))
 
+@admin_bp.get("/products/import")
+@admin_required
+def products_import():
+    return render_template("admin/product_import.html", report=None)
+
+@admin_bp.post("/products/import")
+@admin_required
+def products_import_run():
+    file = request.files.get("file")
+    if not file:
+        flash("Sube un archivo CSV", "warning")
+        return redirect(url_for("admin.products_import"))
+    report = None
+    try:
+        report = run_import(file.stream, dry_run=bool(request.form.get("dry_run")))
+    finally:
+        # También si falló a medias: los lotes ya guardados tienen que verse en el catálogo.
+        if report is None or (not report.dry_run and report.upserted):
+            invalidate_products()
+            invalidate_index()
+    return render_template("admin/product_import.html", report=report)
+
 @admin_bp.get("/products/<int:pid>/edit")
 @admin_required
 def products_edit(pid):
-    p = db_admin().table("products").select("*").eq("id", pid).single().execute().data
+    p, cats, assigned_rows = run_parallel(
+        lambda: getattr(db_admin().table("products").select("*").eq("id", pid).maybe_single().execute(), "data", None),
+        _all_categories,
+        lambda: db_admin().table("product_categories").select("category_id").eq("product_id", pid).execute().data or [],
+    )
     if not p:
         flash("Producto no encontrado", "danger")
         return redirect(url_for("admin.products_list"))
-    cats = db_admin().table("categories").select("id,name,slug").order("name").execute().data or []
-    assigned_rows = db_admin().table("product_categories").select("category_id").eq("product_id", pid).execute().data or []
     assigned = [r["category_id"] for r in assigned_rows]
+    p.update(image_set(p, "detail"))
     return render_template("admin/product_form.html", product=p, categories=cats, assigned=assigned)
 
 @admin_bp.post("/products/<int:pid>/edit")
@@ -70,17 +151,19 @@ def products_update(pid):
         "stock": int(form.get("stock") or 0),
         "active": (form.get("active") == "on"),
     }
-    db_admin().table("products").update(data).eq("id", pid).execute()
+    for row in db_admin().table("products").update(data).eq("id", pid).execute().data or []:
+        search_index.upsert(row)
 
     new_ids = set(int(x) for x in request.form.getlist("categories"))
     cur_rows = db_admin().table("product_categories").select("category_id").eq("product_id", pid).execute().data or []
     cur_ids = set(r["category_id"] for r in cur_rows)
     to_add = new_ids - cur_ids
     to_del = cur_ids - new_ids
-    for cid in to_add:
-        db_admin().table("product_categories").insert({"product_id": pid, "category_id": cid}).execute()
-    for cid in to_del:
-        db_admin().table("product_categories").delete().eq("product_id", pid).eq("category_id", cid).execute()
+    if to_add:
+        db_admin().table("product_categories").insert([{"product_id": pid, "category_id": cid} for cid in to_add]).execute()
+    if to_del:
+        db_admin().table("product_categories").delete().eq("product_id", pid).in_("category_id", list(to_del)).execute()
+    invalidate_products()
     flash("Producto actualizado ✅", "success")
     return redirect(url_for("admin.products_edit", pid=pid))
 
@@ -89,6 +172,8 @@ def products_update(pid):
 def products_delete(pid):
     db_admin().table("product_categories").delete().eq("product_id", pid).execute()
     db_admin().table("products").delete().eq("id", pid).execute()
+    search_index.remove(pid)
+    invalidate_products()
     flash("Producto eliminado ✅", "info")
     return redirect(url_for("admin.products_list"))
 
@@ -106,20 +191,20 @@ def products_upload_image(pid):
     slug = prod["slug"]
     ext = (file.filename.rsplit(".",1)[-1] if "." in file.filename else "jpg").lower()
     path = f"products/{slug}.{ext}"
-    try:
-        storage_admin().from_(BUCKET).remove([path])
-    except Exception:
-        pass
-    storage_admin().from_(BUCKET).upload(path, file.stream, file_options={"cacheControl":"3600","upsert":True})
-    db_admin().table("products").update({"image_path": path}).eq("id", pid).execute()
+    data = file.read()
+    storage_admin().from_(BUCKET).upload(path, data, file_options={"content-type": file.mimetype or "application/octet-stream", "cache-control": "3600", "x-upsert": "true"})
+    version = int(time.time())
+    for row in db_admin().table("products").update({"image_path": path, "image_version": version, "image_variants": False}).eq("id", pid).execute().data or []:
+        search_index.upsert(row)
+    invalidate_products()
+    schedule_variants(pid, path, data, version)
     flash("Imagen actualizada ✅", "success")
     return redirect(url_for("admin.products_edit", pid=pid))
 
 @admin_bp.get("/categories")
 @admin_required
 def categories_list():
-    res = db_admin().table("categories").select("id,name,slug").order("name").execute()
-    cats = res.data or []
+    cats = _all_categories()
     return render_template("admin/categories_list.html", categories=cats)
 
 @admin_bp.get("/categories/new")
@@ -132,6 +217,7 @@ def categories_new():
 def categories_create():
     form = request.form
     db_admin().table("categories").insert({"name": form.get("name"), "slug": form.get("slug")}).execute()
+    invalidate_categories()
     flash("Categoría creada ✅", "success")
     return redirect(url_for("admin.categories_list"))
 
@@ -149,6 +235,7 @@ def categories_edit(cid):
 def categories_update(cid):
     form = request.form
     db_admin().table("categories").update({"name": form.get("name"), "slug": form.get("slug")}).eq("id", cid).execute()
+    invalidate_categories()
     flash("Categoría actualizada ✅", "success")
     return redirect(url_for("admin.categories_list"))
 
@@ -157,23 +244,49 @@ def categories_update(cid):
 def categories_delete(cid):
     db_admin().table("product_categories").delete().eq("category_id", cid).execute()
     db_admin().table("categories").delete().eq("id", cid).execute()
+    invalidate_categories()
     flash("Categoría eliminada ✅", "info")
     return redirect(url_for("admin.categories_list"))
 
 @admin_bp.get("/orders")
 @admin_required
 def orders_list_admin():
-    rows = db_admin().table("orders").select("id,user_id,status,total,currency,payment_status,created_at").order("id", desc=True).execute().data or []
-    return render_template("admin/orders_list.html", orders=rows)
+    query = db_admin().table("orders").select("id,user_id,status,total,currency,payment_status,created_at")
+    page = keyset_page(query, ("id",), request.args.get("after"), request.args.get("before"), page_size(request.args.get("limit")), desc=True)
+    return render_template("admin/orders_list.html", orders=page.items, page=page)
+
+@admin_bp.get("/orders/export")
+@admin_required
+def orders_export():
+    fmt = "jsonl" if request.args.get("format") == "jsonl" else "csv"
+    try:
+        date_from = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        date_to = date.fromisoformat(request.args["to"]) + timedelta(days=1) if request.args.get("to") else None
+    except ValueError:
+        flash("Fechas inválidas (usa AAAA-MM-DD).", "warning")
+        return redirect(url_for("admin.orders_list_admin"))
+    orders = iter_orders(
+        date_from=date_from.isoformat() if date_from else None,
+        date_to=date_to.isoformat() if date_to else None,
+        status=request.args.get("status") or None,
+        payment_status=request.args.get("payment_status") or None,
+    )
+    rows = flatten(orders)
+    body = jsonl_stream(rows) if fmt == "jsonl" else csv_stream(rows)
+    mimetype = "application/x-ndjson" if fmt == "jsonl" else "text/csv"
+    filename = f"ordenes-{date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(body), mimetype=mimetype, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 @admin_bp.get("/orders/<int:oid>")
 @admin_required
 def order_detail_admin(oid):
-    order = db_admin().table("orders").select("*").eq("id", oid).maybe_single().execute().data
+    order, items = run_parallel(
+        lambda: getattr(db_admin().table("orders").select("*").eq("id", oid).maybe_single().execute(), "data", None),
+        lambda: db_admin().table("order_items").select("*").eq("order_id", oid).execute().data or [],
+    )
     if not order:
         flash("Orden no encontrada", "danger")
         return redirect(url_for("admin.orders_list_admin"))
-    items = db_admin().table("order_items").select("*").eq("order_id", oid).execute().data or []
     return render_template("admin/order_view.html", order=order, items=items)
 
 @admin_bp.post("/orders/<int:oid>/status")
@@ -1,83 +1,263 @@
 import os
+import hmac
+import ipaddress
+import time
 from decimal import Decimal, ROUND_HALF_UP
 from urllib.parse import urlencode
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from core import SECRET_KEY, supabase, db_admin, storage_admin, public_url, current_user, login_required, CURRENCY
-
-app = Flask(__name__)
-app.secret_key = SECRET_KEY
+from datetime import datetime
+from markupsafe import Markup
+from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response, g, abort, current_app
+from core import SECRET_KEY, supabase, db_admin, storage_admin, image_set, current_user, login_required, run_parallel, session_cart_count, remember_cart_count, CURRENCY
+from cache import catalog_cache, fragment_cache, catalog_etag, CATALOG_CACHE_TTL
+from search import search_products
+import ipn
+import metrics
+import guest_cart
+from pagination import keyset_page, offset_page, page_size, page_args
+
+class _Views:
+    # Rutas y hooks de la tienda, con la misma forma que en Flask; create_app()
+    # los registra en cada app. Así importar este módulo no crea la app.
+    def __init__(self):
+        self.setup = []
+
+    def _defer(self, register):
+        self.setup.append(register)
+
+    def get(self, rule):
+        return self._route(rule, "GET")
+
+    def post(self, rule):
+        return self._route(rule, "POST")
+
+    def _route(self, rule, method):
+        def decorator(f):
+            self._defer(lambda app: app.add_url_rule(rule, view_func=f, methods=[method]))
+            return f
+        return decorator
+
+    def before_request(self, f):
+        self._defer(lambda app: app.before_request(f))
+        return f
+
+    def after_request(self, f):
+        self._defer(lambda app: app.after_request(f))
+        return f
+
+    def context_processor(self, f):
+        self._defer(lambda app: app.context_processor(f))
+        return f
+
+views = _Views()
+
+def create_app() -> Flask:
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    app.add_template_global(page_args)
+    for register in views.setup:
+        register(app)
+    from admin.routes import admin_bp
+    app.register_blueprint(admin_bp, url_prefix="/admin")
+    return app
+
+WARM_TEMPLATES = ("base.html", "index.html", "_product_grid.html", "_category_nav.html")
+
+def warm_templates(app: Flask):
+    # Compila las plantillas del catálogo antes de la primera petición (ver gunicorn.conf.py).
+    for name in WARM_TEMPLATES:
+        app.jinja_env.get_template(name)
+
+@views.before_request
+def _start_background_workers():
+    ipn.ensure_workers()
+
+@views.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+@views.after_request
+def _finish_request_metrics(resp):
+    elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+    endpoint = request.endpoint or "desconocido"
+    calls = metrics.finish_request(endpoint, request.method, resp.status_code, elapsed)
+    resp.headers["Server-Timing"] = metrics.server_timing(calls, elapsed)
+    if len(calls) > metrics.SUPABASE_CALL_BUDGET:
+        current_app.logger.warning("%s %s hizo %d llamadas a Supabase (presupuesto %d): %s",
+                                   request.method, request.path, len(calls), metrics.SUPABASE_CALL_BUDGET, metrics.summarize(calls))
+    return resp
+
+def _is_loopback():
+    try:
+        return ipaddress.ip_address(request.remote_addr or "").is_loopback and "X-Forwarded-For" not in request.headers
+    except ValueError:
+        return False
+
+@views.get("/metrics")
+def metrics_endpoint():
+    if metrics.METRICS_TOKEN:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(given, metrics.METRICS_TOKEN):
+            abort(401)
+    elif not _is_loopback():
+        # Sin token solo se sirve a un scraper en la misma máquina; lo que llega
+        # por el proxy de la plataforma trae X-Forwarded-For o una IP remota.
+        abort(404)
+    return metrics.render_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 def money(x):
     return Decimal(str(x or 0)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
 def _categories():
+    return catalog_cache.get_or_set(("categories",), _load_categories)
+
+def _load_categories():
     rows = supabase.table("categories").select("id,name,slug").order("name").execute().data
     return rows or []
 
+def _catalog_version():
+    # La sube un trigger con cada cambio de productos o categorías; cada worker
+    # la relee al invalidar el catálogo o, como los datos, tras CATALOG_CACHE_TTL.
+    return catalog_cache.get_or_set(("catalog_version",), _load_catalog_version)
+
+def _load_catalog_version():
+    res = supabase.table("catalog_version").select("version,updated_at").maybe_single().execute()
+    row = getattr(res, "data", None) or {}
+    updated_at = datetime.fromisoformat(row["updated_at"]) if row.get("updated_at") else None
+    return row.get("version", 0), updated_at
+
 def get_or_create_cart(user_id: str):
+    cid = session.get("cart_id")
+    if cid:
+        return cid
     cr = db_admin().table("carts").select("id").eq("user_id", user_id).maybe_single().execute()
-    if cr.data:
-        return cr.data["id"]
-    return db_admin().table("carts").insert({"user_id": user_id}).execute().data[0]["id"]
-
-def load_cart_items(cart_id: str):
-    items = db_admin().table("cart_items").select("id,product_id,qty,price_at_add").eq("cart_id", cart_id).execute().data or []
-    product_ids = [i["product_id"] for i in items]
-    if product_ids:
-        pr = db_admin().table("products").select("id,name,slug,price,image_path,stock").in_("id", product_ids).execute().data or []
-        m = {p["id"]: p for p in pr}
-        for i in items:
-            p = m.get(i["product_id"]) or {}
-            i["product"] = p
-            i["image_url"] = public_url(p.get("image_path"))
-            price = money(p.get("price") if p else i.get("price_at_add") or 0)
-            qty = int(i["qty"] or 1)
-            i["price"] = price
-            i["subtotal"] = money(price * qty)
-    total = money(sum(i["subtotal"] for i in items))
+    if cr:
+        cid = cr.data["id"]
+    else:
+        cid = db_admin().table("carts").insert({"user_id": user_id}).execute().data[0]["id"]
+    session["cart_id"] = cid
+    return cid
+
+def cart_count(user_id: str):
+    cnt = session_cart_count()
+    if cnt is None:
+        cid = get_or_create_cart(user_id)
+        cnt = db_admin().table("cart_items").select("id", count="exact").eq("cart_id", cid).execute().count or 0
+        remember_cart_count(cnt)
+    return cnt
+
+def adjust_cart_count(delta: int):
+    cnt = session_cart_count()
+    if cnt is not None:
+        remember_cart_count(cnt + delta)
+
+def load_cart(user_id: str):
+    data = db_admin().rpc("cart_with_products", {"p_user_id": user_id}).execute().data or {}
+    items, total = _cart_lines(data)
+    remember_cart_count(len(items))
     return items, total
 
-@app.context_processor
+def _cart_lines(data):
+    items = data.get("items") or []
+    for i in items:
+        i.update(image_set(i.get("product") or {}, "thumb"))
+        i["price"] = money(i["price"])
+        i["subtotal"] = money(i["subtotal"])
+    return items, money(data.get("total"))
+
+@views.context_processor
 def inject_globals():
-    count = 0
     u = current_user()
-    if u:
-        cid = get_or_create_cart(u["id"])
-        cnt = db_admin().table("cart_items").select("id", count="exact").eq("cart_id", cid).execute().count or 0
-        count = cnt
+    count = cart_count(u["id"]) if u else guest_cart.count()
     return {"cart_count": count, "CURRENCY": CURRENCY}
 
-@app.get("/")
+def _load_products(cat: str | None, after, before, limit):
+    fields = "id,name,slug,price,stock,image_path,image_version,image_variants,active"
+    if cat:
+        # Inner join embebido: la categoría se filtra en el servidor en la misma consulta.
+        query = supabase.table("products").select(fields + ",categories!inner(slug)").eq("categories.slug", cat)
+    else:
+        query = supabase.table("products").select(fields)
+    page = keyset_page(query.eq("active", True), ("name", "id"), after, before, limit)
+    for p in page.items:
+        p.pop("categories", None)
+        p.update(image_set(p))
+    return page
+
+def _is_personalized():
+    return bool(current_user() or session.get("_flashes") or guest_cart.lines())
+
+def _catalog_cache_headers(resp, etag, last_modified):
+    resp.set_etag(etag, weak=True)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = f"public, max-age=0, s-maxage={int(CATALOG_CACHE_TTL)}, must-revalidate"
+    return resp
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    ims = request.if_modified_since
+    return ims is not None and last_modified is not None and ims >= last_modified.replace(microsecond=0)
+
+@views.get("/")
 def index():
     q = request.args.get("q", "").strip()
     cat = request.args.get("category")
-    query = supabase.table("products").select("id,name,slug,price,stock,image_path,active")
-    if q:
-        query = query.filter("name", "ilike", f"%{q}%")
-    if cat:
-        try:
-            cat_row = supabase.table("categories").select("id").eq("slug", cat).single().execute().data
-            if cat_row:
-                prod_ids = supabase.table("product_categories").select("product_id").eq("category_id", cat_row["id"]).execute().data
-                ids = [r["product_id"] for r in (prod_ids or [])]
-                if ids:
-                    query = query.in_("id", ids)
-                else:
-                    return render_template("index.html", products=[], categories=_categories(), q=q, user=current_user())
-        except Exception:
-            pass
-    res = query.order("name").execute()
-    products = res.data or []
-    products = [p for p in products if p.get("active", True)]
-    for p in products:
-        p["image_url"] = public_url(p.get("image_path"))
-    return render_template("index.html", products=products, categories=_categories(), q=q, user=current_user())
-
-@app.get("/login")
+    after, before = request.args.get("after"), request.args.get("before")
+    limit = page_size(request.args.get("limit"))
+    def render_grid():
+        if q:
+            def fetch(offset, n):
+                hits, total = search_products(q, cat, offset=offset, limit=n)
+                return [dict(p, **image_set(p)) for p in hits], total
+            page = offset_page(fetch, after, before, limit)
+        else:
+            page = catalog_cache.get_or_set(("products", cat, after, before, limit), lambda: _load_products(cat, after, before, limit))
+        return render_template("_product_grid.html", products=page.items, page=page, q=q)
+
+    # Los fragmentos no dependen del usuario; solo base.html se renderiza en cada petición.
+    version, last_modified = _catalog_version()
+    product_grid = fragment_cache.get_or_render(("grid", version, request.full_path), render_grid)
+    category_nav = fragment_cache.get_or_render(("category_nav", version, cat),
+                                                lambda: render_template("_category_nav.html", categories=_categories(), category=cat))
+    # Solo las páginas anónimas son compartibles; con sesión cambian cart_count y el encabezado.
+    shared = not _is_personalized()
+    if shared:
+        # El ETag sale del HTML de los fragmentos: cambia con cada escritura del
+        # admin (nueva versión) y cuando la grilla refrescada muestra otro stock.
+        etag = catalog_etag(product_grid, category_nav)
+        if _not_modified(etag, last_modified):
+            return _catalog_cache_headers(current_app.response_class(status=304), etag, last_modified)
+    resp = make_response(render_template("index.html", product_grid=Markup(product_grid), category_nav=Markup(category_nav), q=q, user=current_user()))
+    if shared:
+        return _catalog_cache_headers(resp, etag, last_modified)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+def _sign_in(user_id: str, email: str):
+    session.pop("cart_id", None)
+    session.pop("cart_count", None)
+    session["user"] = {"id": user_id, "email": email}
+    session.permanent = True
+    _merge_guest_cart(user_id)
+
+def _merge_guest_cart(user_id: str) -> bool:
+    # El login no depende de la fusión: si falla, el carrito de invitado queda
+    # en la sesión y se vuelve a intentar al abrir el carrito.
+    try:
+        guest_cart.merge(user_id)
+        return True
+    except Exception:
+        current_app.logger.exception("No se pudo fusionar el carrito de invitado de %s", user_id)
+        flash("No pudimos agregar a tu carrito los productos que elegiste sin sesión; lo intentaremos de nuevo al abrir el carrito.", "warning")
+        return False
+
+@views.get("/login")
 def login():
     return render_template("login.html")
 
-@app.post("/login")
+@views.post("/login")
 def login_post():
     email = request.form.get("email","").strip()
     password = request.form.get("password","")
@@ -85,38 +265,36 @@ def login_post():
         auth_res = supabase.auth.sign_in_with_password({"email": email, "password": password})
         if not getattr(auth_res, "user", None):
             flash("Credenciales inválidas", "danger"); return redirect(url_for("login"))
-        session["user"] = {"id": auth_res.user.id, "email": email}
-        session.permanent = True
+        _sign_in(auth_res.user.id, email)
         flash("Bienvenido.", "success")
         return redirect(url_for("index"))
     except Exception as e:
         flash(str(e), "danger"); return redirect(url_for("login"))
 
-@app.get("/register")
+@views.get("/register")
 def register():
     return render_template("register.html")
 
-@app.post("/register")
+@views.post("/register")
 def register_post():
     email = request.form.get("email","").strip()
     password = request.form.get("password","")
     try:
         res = supabase.auth.sign_up({"email": email, "password": password})
         if getattr(res, "user", None):
-            session["user"] = {"id": res.user.id, "email": email}
-            session.permanent = True
+            _sign_in(res.user.id, email)
         flash("Cuenta creada.", "success")
         return redirect(url_for("index"))
     except Exception as e:
         flash(str(e), "danger"); return redirect(url_for("register"))
 
-@app.post("/logout")
+@views.post("/logout")
 def logout():
     session.clear()
     flash("Sesión cerrada.", "info")
     return redirect(url_for("index"))
 
-@app.get("/profile")
+@views.get("/profile")
 def profile():
     u = current_user()
     if not u:
@@ -125,7 +303,7 @@ def profile():
     addrs = db_admin().table("addresses").select("*").eq("user_id", u["id"]).order("created_at").execute().data or []
     return render_template("profile.html", addresses=addrs)
 
-@app.post("/profile/address")
+@views.post("/profile/address")
 def profile_add_address():
     u = current_user()
     if not u:
@@ -149,7 +327,7 @@ def profile_add_address():
     flash("Dirección guardada ✅", "success")
     return redirect(url_for("profile"))
 
-@app.post("/profile/address/<int:aid>/delete")
+@views.post("/profile/address/<int:aid>/delete")
 def profile_delete_address(aid):
     u = current_user()
     if not u:
@@ -159,55 +337,64 @@ def profile_delete_address(aid):
     flash("Dirección eliminada ✅", "info")
     return redirect(url_for("profile"))
 
-@app.get("/cart")
+@views.get("/cart")
 def cart_view():
     u = current_user()
-    if not u:
-        flash("Debes iniciar sesión.", "warning")
-        return redirect(url_for("login", next=request.path))
-    cid = get_or_create_cart(u["id"])
-    items, total = load_cart_items(cid)
+    if u and guest_cart.lines():
+        _merge_guest_cart(u["id"])
+    items, total = load_cart(u["id"]) if u else _cart_lines(guest_cart.load())
     return render_template("cart.html", items=items, total=total)
 
-@app.post("/cart/add")
+@views.post("/cart/add")
 def cart_add():
     u = current_user()
-    if not u:
-        flash("Debes iniciar sesión.", "warning")
-        return redirect(url_for("login", next=request.path))
-    cid = get_or_create_cart(u["id"])
     pid = int(request.form.get("product_id"))
     qty = int(request.form.get("qty") or 1)
-    row = db_admin().table("cart_items").select("id,qty").eq("cart_id", cid).eq("product_id", pid).maybe_single().execute().data
+    if not u:
+        # Sin sesión no se consulta el stock; create_order_with_items lo valida al pagar.
+        if guest_cart.add(pid, qty):
+            flash("Producto agregado al carrito 🛒", "success")
+        else:
+            flash(f"El carrito admite hasta {guest_cart.GUEST_CART_MAX_ITEMS} productos distintos. Inicia sesión para agregar más.", "warning")
+        return redirect(request.referrer or url_for("index"))
+    cid = get_or_create_cart(u["id"])
+    # maybe_single() devuelve None, no una respuesta vacía, cuando no hay filas.
+    row = getattr(db_admin().table("cart_items").select("id,qty").eq("cart_id", cid).eq("product_id", pid).maybe_single().execute(), "data", None)
     if row:
         db_admin().table("cart_items").update({"qty": row["qty"] + qty}).eq("id", row["id"]).execute()
     else:
-        pr = db_admin().table("products").select("price").eq("id", pid).single().execute().data
+        pr = db_admin().table("products").select("price,stock").eq("id", pid).single().execute().data
+        if (pr.get("stock") or 0) < qty:
+            flash(f"Solo hay {pr.get('stock') or 0} unidades disponibles.", "warning")
+            return redirect(request.referrer or url_for("index"))
         db_admin().table("cart_items").insert({"cart_id": cid, "product_id": pid, "qty": qty, "price_at_add": pr["price"]}).execute()
+        adjust_cart_count(1)
     flash("Producto agregado al carrito 🛒", "success")
     return redirect(request.referrer or url_for("index"))
 
-@app.post("/cart/update")
+@views.post("/cart/update")
 def cart_update():
     u = current_user()
-    if not u:
-        flash("Debes iniciar sesión.", "warning")
-        return redirect(url_for("login", next=request.path))
-    cid = get_or_create_cart(u["id"])
     iid = int(request.form.get("item_id"))
     qty = max(1, int(request.form.get("qty") or 1))
+    if not u:
+        guest_cart.update(iid, qty)
+        return redirect(url_for("cart_view"))
+    cid = get_or_create_cart(u["id"])
     db_admin().table("cart_items").update({"qty": qty}).eq("id", iid).eq("cart_id", cid).execute()
     return redirect(url_for("cart_view"))
 
-@app.post("/cart/remove")
+@views.post("/cart/remove")
 def cart_remove():
     u = current_user()
+    iid = int(request.form.get("item_id"))
     if not u:
-        flash("Debes iniciar sesión.", "warning")
-        return redirect(url_for("login", next=request.path))
+        guest_cart.remove(iid)
+        flash("Producto removido del carrito", "info")
+        return redirect(url_for("cart_view"))
     cid = get_or_create_cart(u["id"])
-    iid = int(request.form.get("item_id"))
-    db_admin().table("cart_items").delete().eq("id", iid).eq("cart_id", cid).execute()
+    removed = db_admin().table("cart_items").delete().eq("id", iid).eq("cart_id", cid).execute().data or []
+    adjust_cart_count(-len(removed))
     flash("Producto removido del carrito", "info")
     return redirect(url_for("cart_view"))
 
@@ -227,18 +414,19 @@ def build_pagadi_payload(order, amount, return_ok, return_error, notify_url):
     }
     return payload
 
-@app.get("/checkout")
+@views.get("/checkout")
 def checkout_view():
     u = current_user()
     if not u:
         flash("Debes iniciar sesión.", "warning")
         return redirect(url_for("login", next=request.path))
-    cid = get_or_create_cart(u["id"])
-    items, total = load_cart_items(cid)
-    addrs = db_admin().table("addresses").select("*").eq("user_id", u["id"]).order("is_default").execute().data or []
+    (items, total), addrs = run_parallel(
+        lambda: load_cart(u["id"]),
+        lambda: db_admin().table("addresses").select("*").eq("user_id", u["id"]).order("is_default").execute().data or [],
+    )
     return render_template("checkout.html", items=items, total=total, addresses=addrs)
 
-@app.post("/checkout/pay")
+@views.post("/checkout/pay")
 def checkout_pay():
     if not current_user():
         flash("Debes iniciar sesión.", "warning"); return redirect(url_for("login"))
@@ -247,8 +435,7 @@ def checkout_pay():
         return redirect(url_for("checkout_view"))
 
     u = current_user()
-    cid = get_or_create_cart(u["id"])
-    items, total = load_cart_items(cid)
+    items, total = load_cart(u["id"])
     if not items:
         flash("Carrito vacío.", "warning"); return redirect(url_for("cart_view"))
 
@@ -258,25 +445,26 @@ def checkout_pay():
         return redirect(url_for("checkout_view"))
     addr = db_admin().table("addresses").select("*").eq("id", int(address_id)).eq("user_id", u["id"]).single().execute().data
 
-    order = db_admin().table("orders").insert({
-        "user_id": u["id"],
-        "status": "pending",
-        "total": float(total),
-        "currency": "GTQ",
-        "payment_method": "pagadito",
-        "payment_status": "unpaid",
-        "address_snapshot": addr
-    }).execute().data[0]
-
-    for it in items:
-        db_admin().table("order_items").insert({
-            "order_id": order["id"],
-            "product_id": it["product_id"],
-            "name": it["product"]["name"],
-            "price": float(it["price"]),
-            "qty": int(it["qty"]),
-            "subtotal": float(it["subtotal"])
-        }).execute()
+    try:
+        order = db_admin().rpc("create_order_with_items", {
+            "p_user_id": u["id"],
+            "p_total": float(total),
+            "p_currency": "GTQ",
+            "p_payment_method": "pagadito",
+            "p_address": addr,
+            "p_items": [{
+                "product_id": it["product_id"],
+                "name": it["product"]["name"],
+                "price": float(it["price"]),
+                "qty": int(it["qty"]),
+                "subtotal": float(it["subtotal"])
+            } for it in items],
+        }).execute().data
+    except Exception as e:
+        if "insufficient_stock" not in str(e):
+            raise
+        flash("No hay existencias suficientes para uno de los productos del carrito.", "warning")
+        return redirect(url_for("cart_view"))
 
     base_url = os.environ.get("PAGADITO_CHECKOUT_URL", "https://sandbox.pagadi.to/checkout")
     return_ok = url_for("pagadito_return_ok", order_id=order["id"], _external=True)
@@ -287,28 +475,38 @@ def checkout_pay():
     query = urlencode(payload)
     return redirect(f"{base_url}?{query}")
 
-@app.get("/payments/pagadito/return-ok")
+def _own_order_id(u) -> int:
+    # El order_id llega en la URL de retorno: solo se acepta si la orden es del usuario.
+    order_id = request.args.get("order_id", type=int)
+    if order_id is None:
+        abort(400)
+    row = getattr(db_admin().table("orders").select("id").eq("id", order_id).eq("user_id", u["id"]).maybe_single().execute(), "data", None)
+    if not row:
+        abort(404)
+    return order_id
+
+@views.get("/payments/pagadito/return-ok")
 def pagadito_return_ok():
-    if not current_user():
-        return redirect(url_for("login"))
-    order_id = int(request.args.get("order_id"))
-    db_admin().table("orders").update({"status": "paid", "payment_status": "paid"}).eq("id", order_id).execute()
     u = current_user()
+    if not u:
+        return redirect(url_for("login"))
+    ipn.apply_payment(_own_order_id(u), "paid")
     cid = get_or_create_cart(u["id"])
     db_admin().table("cart_items").delete().eq("cart_id", cid).execute()
+    remember_cart_count(0)
     flash("Pago realizado. ¡Gracias por tu compra! 🎉", "success")
     return redirect(url_for("orders_list"))
 
-@app.get("/payments/pagadito/return-error")
+@views.get("/payments/pagadito/return-error")
 def pagadito_return_error():
-    if not current_user():
+    u = current_user()
+    if not u:
         return redirect(url_for("login"))
-    order_id = int(request.args.get("order_id"))
-    db_admin().table("orders").update({"status": "pending", "payment_status": "failed"}).eq("id", order_id).execute()
+    ipn.apply_payment(_own_order_id(u), "failed")
     flash("Pago cancelado o fallido.", "warning")
     return redirect(url_for("checkout_view"))
 
-@app.post("/payments/pagadito/ipn")
+@views.post("/payments/pagadito/ipn")
 def pagadito_ipn():
     ref = request.form.get("reference") or request.args.get("reference")
     status = request.form.get("status") or request.args.get("status")
@@ -322,33 +520,20 @@ def pagadito_ipn():
     except Exception:
         return ("bad reference", 400)
 
-    if status.lower() in ("paid","approved","completed","success"):
-        db_admin().table("orders").update({
-            "status": "paid",
-            "payment_status": "paid",
-            "gateway_ref": gateway_ref
-        }).eq("id", oid).execute()
-    else:
-        db_admin().table("orders").update({
-            "status": "pending",
-            "payment_status": "failed",
-            "gateway_ref": gateway_ref
-        }).eq("id", oid).execute()
-
+    ipn.enqueue(oid, str(ref), status, gateway_ref)
     return ("OK", 200)
 
-@app.get("/orders")
+@views.get("/orders")
 def orders_list():
     u = current_user()
     if not u:
         flash("Debes iniciar sesión.", "warning"); return redirect(url_for("login"))
-    rows = db_admin().table("orders").select("id,status,total,currency,created_at,payment_status").eq("user_id", u["id"]).order("id", desc=True).execute().data or []
-    return render_template("orders.html", orders=rows)
-
-from admin.routes import admin_bp
-app.register_blueprint(admin_bp, url_prefix="/admin")
+    query = db_admin().table("orders").select("id,status,total,currency,created_at,payment_status").eq("user_id", u["id"])
+    page = keyset_page(query, ("id",), request.args.get("after"), request.args.get("before"), page_size(request.args.get("limit")), desc=True)
+    return render_template("orders.html", orders=page.items, page=page)
 
 if __name__ == "__main__":
     from datetime import timedelta
+    app = create_app()
     app.permanent_session_lifetime = timedelta(days=7)
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
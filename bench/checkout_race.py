@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import random
+import argparse
+import threading
+from collections import Counter
+from bench.explain import SCHEMA_PATH, SUPABASE_STUBS
+
+# Checkouts concurrentes sobre un mismo producto contra un Postgres local: cada
+# hilo llama a create_order_with_items con su propia conexión, como varios
+# workers a la vez. Después paga unas órdenes, rechaza otras y, mientras nuevas
+# compras se llevan las unidades liberadas, confirma con commit_stock órdenes
+# cuya reserva ya se había devuelto (el "paid" que llega tras un "failed").
+# Falla si el stock queda negativo, si se vendieron más unidades de las que
+# había o si las reservas no cuadran con el stock.
+# Requiere 'pip install "psycopg[binary]"'.
+
+ORDER_SQL = "select public.create_order_with_items(%s, 1, 'GTQ', 'pagadito', '{}'::jsonb, %s::jsonb)"
+
+def _race(dsn, n, target):
+    # Todos los hilos arrancan a la vez; cada resultado es (índice, ok, valor).
+    import psycopg
+    barrier = threading.Barrier(n)
+    results = []
+    lock = threading.Lock()
+
+    def run(i):
+        with psycopg.connect(dsn, autocommit=True) as conn:
+            barrier.wait()
+            try:
+                value = target(conn, i)
+                ok = True
+            except psycopg.Error as e:
+                value, ok = e.diag.message_primary or str(e), False
+        with lock:
+            results.append((i, ok, value))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checkouts concurrentes sobre un producto contra un Postgres local.")
+    parser.add_argument("--dsn", default=os.environ.get("EXPLAIN_DSN", "postgresql://postgres@localhost/postgres"),
+                        help="servidor Postgres local; se crea y borra una base temporal")
+    parser.add_argument("--database", default="bodegona_checkout_race")
+    parser.add_argument("--schema", default=SCHEMA_PATH, help="esquema a cargar (por defecto SQL_SUPABASE.sql)")
+    parser.add_argument("--buyers", type=int, default=32, help="checkouts simultáneos")
+    parser.add_argument("--stock", type=int, default=20, help="unidades del producto")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    try:
+        import psycopg
+        from psycopg import sql
+    except ImportError:
+        sys.exit('Falta psycopg: pip install "psycopg[binary]"')
+
+    admin = psycopg.connect(args.dsn, autocommit=True)
+    admin.execute(sql.SQL("drop database if exists {}").format(sql.Identifier(args.database)))
+    admin.execute(sql.SQL("create database {}").format(sql.Identifier(args.database)))
+    errors = []
+    try:
+        target = psycopg.conninfo.make_conninfo(args.dsn, dbname=args.database)
+        with psycopg.connect(target, autocommit=True) as conn:
+            conn.execute(SUPABASE_STUBS)
+            with open(args.schema, encoding="utf-8") as f:
+                conn.execute(f.read())
+            users = [r[0] for r in conn.execute("insert into auth.users (id) select gen_random_uuid() from generate_series(1, %s) returning id",
+                                                [args.buyers * 2]).fetchall()]
+            pid = conn.execute("insert into public.products (name, slug, price, stock) values ('Café', 'cafe', 10, %s) returning id",
+                               [args.stock]).fetchone()[0]
+
+            def stock():
+                return conn.execute("select stock from public.products where id = %s", [pid]).fetchone()[0]
+
+            def reserved(status):
+                return conn.execute("select coalesce(sum(qty), 0) from public.stock_reservations where product_id = %s and status = %s",
+                                    [pid, status]).fetchone()[0]
+
+            def check(stage):
+                s, held, committed = stock(), reserved("held"), reserved("committed")
+                if s < 0:
+                    errors.append(f"{stage}: stock negativo ({s})")
+                if s + held + committed != args.stock:
+                    errors.append(f"{stage}: stock {s} + reservado {held} + vendido {committed} != {args.stock}")
+                print(f"{stage:<44} stock {s:>4}  reservado {held:>4}  vendido {committed:>4}")
+
+            # 1) Más compradores que unidades, todos a la vez.
+            qty = [rng.randint(1, 3) for _ in range(args.buyers)]
+
+            def checkout(c, i):
+                items = json.dumps([{"product_id": pid, "name": "Café", "price": 10, "qty": qty[i], "subtotal": 10 * qty[i]}])
+                return c.execute(ORDER_SQL, [users[i], items]).fetchone()[0]["id"]
+
+            first = _race(target, args.buyers, checkout)
+            placed = [(i, v) for i, ok, v in first if ok]
+            rejected = Counter(v.split(":")[0] for _, ok, v in first if not ok)
+            if set(rejected) - {"insufficient_stock"}:
+                errors.append(f"errores inesperados en el checkout: {dict(rejected)}")
+            if sum(qty[i] for i, _ in placed) > args.stock:
+                errors.append(f"se reservaron {sum(qty[i] for i, _ in placed)} unidades de {args.stock}")
+            print(f"{len(placed)} checkouts aceptados y {sum(rejected.values())} rechazados por falta de stock")
+            check("tras los checkouts")
+
+            # 2) Pagos y rechazos a la vez: commit_stock o release_stock por orden.
+            paid = {oid for _, oid in placed[::2]}
+            failed = [oid for _, oid in placed[1::2]]
+            orders = [oid for _, oid in placed]
+
+            def settle(c, i):
+                fn = "commit_stock" if orders[i] in paid else "release_stock"
+                return c.execute(sql.SQL("select public.{}(%s)").format(sql.Identifier(fn)), [orders[i]]).fetchone()[0]
+
+            _race(target, len(orders), settle)
+            check("tras pagos y rechazos")
+
+            # 3) Nuevos compradores se llevan lo liberado mientras llega el "paid"
+            # atrasado de las órdenes rechazadas: commit_stock no puede dejar stock negativo.
+            late_buyers = args.buyers
+
+            def late(c, i):
+                if i >= len(failed):
+                    return checkout(c, i - len(failed) + args.buyers)
+                # Lo mismo que ipn.apply_payment: el backorder se marca en otra sentencia.
+                short = c.execute("select public.commit_stock(%s)", [failed[i]]).fetchone()[0]
+                if short:
+                    c.execute("update public.orders set status = 'backorder' where id = %s", [failed[i]])
+                return short
+
+            qty += [rng.randint(1, 3) for _ in range(late_buyers)]
+            third = _race(target, len(failed) + late_buyers, late)
+            unexpected = [v for _, ok, v in third if not ok and not str(v).startswith("insufficient_stock")]
+            if unexpected:
+                errors.append(f"errores inesperados: {unexpected[:3]}")
+            check("tras el paid atrasado y nuevas compras")
+            backorder = conn.execute("select count(*) from public.orders where id = any(%s) and status = 'backorder'", [failed]).fetchone()[0]
+            uncommitted = conn.execute("select count(distinct order_id) from public.stock_reservations where order_id = any(%s) and status = 'released'",
+                                       [failed]).fetchone()[0]
+            if backorder != uncommitted:
+                errors.append(f"{uncommitted} órdenes pagadas sin unidades pero {backorder} marcadas como backorder")
+            print(f"{len(failed) - uncommitted} órdenes rechazadas volvieron a descontar stock al pagarse, {backorder} quedaron como backorder")
+    finally:
+        admin.execute(sql.SQL("drop database if exists {}").format(sql.Identifier(args.database)))
+        admin.close()
+    if errors:
+        sys.exit("\n".join(errors))
+    print("sin sobreventa ni stock negativo")
+
+if __name__ == "__main__":
+    main()
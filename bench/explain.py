@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import argparse
+
+# Comprueba con EXPLAIN que las consultas de la app usan índices. Carga
+# SQL_SUPABASE.sql en una base temporal de un Postgres local (con stubs de
+# auth/storage de Supabase), la llena con datos y falla si alguna consulta
+# recorre secuencialmente una tabla grande.
+# Requiere 'pip install "psycopg[binary]"'.
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SQL_SUPABASE.sql")
+BIG_TABLES = {"products", "product_categories", "carts", "cart_items", "orders", "order_items", "addresses", "stock_reservations"}
+
+SUPABASE_STUBS = """
+do $$
+begin
+  if not exists (select 1 from pg_roles where rolname = 'anon') then create role anon nologin; end if;
+  if not exists (select 1 from pg_roles where rolname = 'authenticated') then create role authenticated nologin; end if;
+end $$;
+create schema auth;
+create table auth.users (id uuid primary key default gen_random_uuid());
+create function auth.uid() returns uuid language sql stable as $$
+  select nullif(current_setting('request.jwt.claim.sub', true), '')::uuid
+$$;
+create schema storage;
+create table storage.buckets (id text primary key, public boolean default false);
+create table storage.objects (bucket_id text, name text);
+create function storage.create_bucket(id text, public boolean default false) returns text language sql as $$
+  insert into storage.buckets values (id, public) returning id
+$$;
+grant usage on schema public, auth to anon, authenticated;
+"""
+
+SEED = """
+insert into auth.users (id) select gen_random_uuid() from generate_series(1, %(users)s);
+insert into public.categories (name, slug) select 'Categoría ' || g, 'categoria-' || g from generate_series(1, %(categories)s) g;
+insert into public.products (name, slug, description, price, stock, active)
+  select n.noun || ' ' || n.brand || ' ' || g, 'producto-' || g, 'Descripción del producto ' || g,
+         round((random() * 200)::numeric, 2), (random() * 100)::int, random() > 0.05
+  from generate_series(1, %(products)s) g,
+       lateral (select (array['Arroz','Frijol','Leche','Café','Azúcar','Aceite','Harina','Pasta','Atún','Galletas',
+                              'Jabón','Detergente','Cereal','Avena','Yogur','Queso','Jugo','Refresco','Sopa','Chocolate'])[1 + g %% 20] as noun,
+                       (array['Don Justo','La Estrella','Maravilla','Campestre','San Miguel','El Molino','Ducal',
+                              'Malher','Señorial','Naturas'])[1 + (g / 20) %% 10] as brand) n;
+insert into public.product_categories (product_id, category_id)
+  select g, 1 + g %% %(categories)s from generate_series(1, %(products)s) g;
+insert into public.carts (user_id) select id from auth.users;
+insert into public.cart_items (cart_id, product_id, qty)
+  select c.id, 1 + abs(hashtext(c.id::text || k)) %% %(products)s, 1 from public.carts c, generate_series(1, 3) k
+  on conflict do nothing;
+insert into public.addresses (user_id, full_name, line1, city) select id, 'Cliente', '1 Avenida', 'Guatemala' from auth.users;
+with u as (select array_agg(id) as ids from auth.users)
+insert into public.orders (user_id, status, total, payment_status, created_at)
+  select u.ids[1 + g %% array_length(u.ids, 1)],
+         case when g %% 3 = 0 then 'pending' else 'paid' end, round((random() * 500)::numeric, 2),
+         case when g %% 3 = 0 then 'unpaid' else 'paid' end, now() - (g %% 365) * interval '1 day'
+  from u, generate_series(1, %(orders)s) g;
+insert into public.order_items (order_id, product_id, name, price, qty, subtotal)
+  select o.id, 1 + (o.id * k) %% %(products)s, 'Producto', 10, 1, 10 from public.orders o, generate_series(1, 2) k;
+insert into public.stock_reservations (order_id, product_id, qty, expires_at)
+  select o.id, 1 + o.id %% %(products)s, 1, now() + interval '30 minutes' from public.orders o where o.payment_status = 'unpaid';
+analyze;
+"""
+
+SAMPLES = """
+select (select id from public.carts order by id limit 1) as cart_id,
+       (select user_id from public.carts order by id limit 1) as user_id,
+       (select product_id from public.cart_items order by id limit 1) as product_id,
+       (select max(id) / 2 from public.orders) as order_id,
+       (select slug from public.categories order by id limit 1) as slug,
+       (select name from public.products where active order by name, id offset 100 limit 1) as name
+"""
+
+# (descripción, consulta, rol) — equivalentes SQL de las consultas que PostgREST genera para la app.
+CHECKS = [
+    ("catálogo (primera página)", "select * from public.products where active order by name, id limit 25", None),
+    ("catálogo (keyset)", "select * from public.products where active and (name > %(name)s or (name = %(name)s and id > 100)) order by name, id limit 25", None),
+    ("catálogo por categoría", """select p.* from public.products p
+        where p.active and exists (select 1 from public.product_categories pc join public.categories c on c.id = pc.category_id
+                                   where pc.product_id = p.id and c.slug = %(slug)s)
+        order by p.name, p.id limit 25""", None),
+    # Vocabulario repetido como en un catálogo real: con nombres únicos no hay estadísticas del tsvector y el planner no usa el GIN.
+    ("búsqueda", "select id from public.products where active and search_tsv @@ to_tsquery('public.es_unaccent', $$'arroz':* & 'maravilla':*$$)", None),
+    ("carrito del usuario", "select id from public.carts where user_id = %(user_id)s", None),
+    ("línea del carrito (cart_add)", "select id, qty from public.cart_items where cart_id = %(cart_id)s and product_id = %(product_id)s", None),
+    ("líneas del carrito", "select * from public.cart_items where cart_id = %(cart_id)s", None),
+    ("conteo del carrito", "select count(*) from public.cart_items where cart_id = %(cart_id)s", None),
+    ("direcciones", "select * from public.addresses where user_id = %(user_id)s order by created_at", None),
+    ("órdenes del usuario", "select id, status, total from public.orders where user_id = %(user_id)s order by id desc limit 25", None),
+    ("artículos de la orden", "select * from public.order_items where order_id = %(order_id)s", None),
+    ("reservas de la orden", "select * from public.stock_reservations where order_id = %(order_id)s and status = 'held'", None),
+    ("exportación por fecha", "select * from public.orders where created_at >= now() - interval '7 days' and id > 0 order by id limit 500", None),
+    ("productos de una categoría (búsqueda en memoria)", "select product_id from public.product_categories pc join public.categories c on c.id = pc.category_id where c.slug = %(slug)s", None),
+    ("RLS: carrito propio", "select * from public.cart_items where cart_id = %(cart_id)s", "authenticated"),
+    ("RLS: órdenes propias", "select id from public.orders order by id desc limit 25", "authenticated"),
+]
+
+def seq_scans(plan):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in BIG_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+def indexes_used(plan):
+    used = [plan["Index Name"]] if "Index Name" in plan else []
+    for child in plan.get("Plans", []):
+        used += indexes_used(child)
+    return used
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica con EXPLAIN que las consultas de la app usan índices.")
+    parser.add_argument("--dsn", default=os.environ.get("EXPLAIN_DSN", "postgresql://postgres@localhost/postgres"),
+                        help="servidor Postgres local; se crea y borra una base temporal")
+    parser.add_argument("--database", default="bodegona_explain")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--keep", action="store_true", help="no borra la base al terminar")
+    args = parser.parse_args(argv)
+
+    try:
+        import psycopg
+        from psycopg import sql
+    except ImportError:
+        sys.exit('Falta psycopg: pip install "psycopg[binary]"')
+
+    admin = psycopg.connect(args.dsn, autocommit=True)
+    admin.execute(sql.SQL("drop database if exists {}").format(sql.Identifier(args.database)))
+    admin.execute(sql.SQL("create database {}").format(sql.Identifier(args.database)))
+    failures = []
+    try:
+        target = psycopg.conninfo.make_conninfo(args.dsn, dbname=args.database)
+        with psycopg.connect(target, autocommit=True, cursor_factory=psycopg.ClientCursor) as conn:
+            conn.execute(SUPABASE_STUBS)
+            with open(SCHEMA_PATH, encoding="utf-8") as f:
+                conn.execute(f.read())
+            conn.execute("grant select on all tables in schema public to anon, authenticated")
+            print("sembrando datos...", file=sys.stderr)
+            conn.cursor().execute(SEED, vars(args))
+            cur = conn.cursor(row_factory=psycopg.rows.dict_row)
+            params = cur.execute(SAMPLES).fetchone()
+            for name, query, role in CHECKS:
+                with conn.transaction():
+                    if role:
+                        conn.execute(sql.SQL("set local role {}").format(sql.Identifier(role)))
+                        conn.execute("select set_config('request.jwt.claim.sub', %s, true)", [str(params["user_id"])])
+                    plan = cur.execute("explain (format json) " + query, params).fetchone()["QUERY PLAN"]
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+                scans = seq_scans(plan)
+                status = "FALLA" if scans else "ok"
+                detail = f"seq scan en {', '.join(scans)}" if scans else ", ".join(dict.fromkeys(indexes_used(plan))) or "-"
+                print(f"{status:<6} {name:<50} {detail}")
+                if scans:
+                    failures.append(name)
+    finally:
+        if not args.keep:
+            admin.execute(sql.SQL("drop database if exists {}").format(sql.Identifier(args.database)))
+        admin.close()
+    if failures:
+        sys.exit(f"{len(failures)} consultas sin índice: {', '.join(failures)}")
+
+if __name__ == "__main__":
+    main()
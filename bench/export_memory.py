@@ -0,0 +1,84 @@
+import gc
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from bench.fake_supabase import FakeSupabase
+from bench.seed import seed
+from bench.run import boot
+
+# Exporta todas las órdenes de la semilla (1m por defecto) por
+# /admin/orders/export y comprueba que la memoria no crece con el historial:
+# tracemalloc mide el pico de lo asignado durante la descarga y /proc el RSS.
+# La semilla de 1m tarda un par de minutos y ocupa varios GB antes de empezar.
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def export(client, fmt):
+    started = time.perf_counter()
+    rss_start = peak_rss = rss_mb()
+    tracemalloc.start()
+    resp = client.get(f"/admin/orders/export?format={fmt}", buffered=False)
+    size = lines = chunks = 0
+    for chunk in resp.response:
+        size += len(chunk)
+        lines += chunk.count(b"\n" if isinstance(chunk, bytes) else "\n")
+        chunks += 1
+        if chunks % 64 == 0:
+            peak_rss = max(peak_rss, rss_mb())
+    resp.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"status": resp.status_code, "mb": size / 2**20, "lines": lines, "seconds": time.perf_counter() - started,
+            "traced_peak_mb": peak / 2**20, "rss_growth_mb": max(peak_rss, rss_mb()) - rss_start}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoria de la exportación de órdenes sobre todo el historial.")
+    parser.add_argument("--scale", choices=("1k", "100k", "1m"), default="1m")
+    parser.add_argument("--format", choices=("csv", "jsonl", "both"), default="csv")
+    parser.add_argument("--max-traced-mb", type=float, default=64, help="pico máximo asignado durante la exportación")
+    parser.add_argument("--max-rss-mb", type=float, default=128, help="crecimiento máximo del RSS durante la exportación")
+    args = parser.parse_args(argv)
+
+    print(f"sembrando {args.scale}...", file=sys.stderr)
+    db = FakeSupabase(0, 0)
+    ctx = seed(db, args.scale)
+    client = boot(db, "memory").test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": ctx.admin_id, "email": "admin@bench"}
+    orders, items = len(db.tables["orders"].rows), len(db.tables["order_items"].rows)
+    # Calienta clientes, plantillas e importaciones perezosas para no medirlos.
+    for fmt in ("csv", "jsonl"):
+        client.get(f"/admin/orders/export?format={fmt}&from=2999-01-01").close()
+    # La semilla deja millones de objetos del Supabase en memoria en este mismo
+    # proceso; sin congelarlos el GC casi nunca hace una pasada completa y el
+    # pico mediría la basura cíclica de httpx acumulada, no la exportación.
+    # freeze() no reinicia la cuenta de objetos de la generación más vieja;
+    # la pasada completa de después sí, y ya no recorre lo congelado.
+    gc.collect()
+    gc.freeze()
+    gc.collect()
+    print(f"{orders} órdenes, {items} artículos")
+
+    failures = []
+    for fmt in (("csv", "jsonl") if args.format == "both" else (args.format,)):
+        r = export(client, fmt)
+        print(f"{fmt:<6} status {r['status']}  {r['lines']} líneas  {r['mb']:.1f} MB en {r['seconds']:.0f} s  "
+              f"pico asignado {r['traced_peak_mb']:.1f} MB  crecimiento RSS {r['rss_growth_mb']:.1f} MB")
+        # Una línea por artículo (o por orden sin artículos) más la cabecera del CSV.
+        expected = items + (fmt == "csv")
+        if r["status"] != 200 or r["lines"] < expected:
+            failures.append(f"{fmt}: status {r['status']}, {r['lines']} líneas de al menos {expected}")
+        if r["traced_peak_mb"] > args.max_traced_mb:
+            failures.append(f"{fmt}: pico asignado {r['traced_peak_mb']:.1f} MB > {args.max_traced_mb:.0f} MB")
+        if r["rss_growth_mb"] > args.max_rss_mb:
+            failures.append(f"{fmt}: el RSS creció {r['rss_growth_mb']:.1f} MB > {args.max_rss_mb:.0f} MB")
+    if failures:
+        sys.exit("\n".join(failures))
+    print("memoria acotada durante toda la exportación")
+
+if __name__ == "__main__":
+    main()
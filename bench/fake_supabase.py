@@ -0,0 +1,721 @@
+import re
+import json
+import time
+import uuid
+import random
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+import httpx
+
+# Contador de la petición en curso: [llamadas, segundos de CPU del emulador].
+# run_parallel copia el contexto, así que las consultas en paralelo también suman.
+request_trips: ContextVar = ContextVar("bench_trips", default=None)
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+class PgError(Exception):
+    def __init__(self, code, message, status=400, details=None):
+        super().__init__(message)
+        self.code, self.message, self.status, self.details = code, message, status, details
+
+    def body(self):
+        return {"code": self.code, "message": self.message, "details": self.details, "hint": None}
+
+class Table:
+    def __init__(self, name, pk=("id",), indexes=(), unique=(), defaults=None, serial=True):
+        self.name = name
+        self.pk = pk
+        self.serial = serial and pk == ("id",)
+        self.rows = {}
+        self.indexes = {col: {} for col in (*pk, *indexes) if len(pk) > 1 or col != pk[0]}
+        self.unique = {cols: {} for cols in unique}
+        self.defaults = defaults or {}
+        self.next_id = 1
+        self.version = 0
+        self._sorted = {}
+
+    def key(self, row):
+        return row[self.pk[0]] if len(self.pk) == 1 else tuple(row[c] for c in self.pk)
+
+    def lookup(self, col, value):
+        if len(self.pk) == 1 and col == self.pk[0]:
+            return {value} if value in self.rows else set()
+        return self.indexes[col].get(value, set())
+
+    def _index(self, pk, row, add=True):
+        for col, index in self.indexes.items():
+            bucket = index.setdefault(row.get(col), set())
+            bucket.add(pk) if add else bucket.discard(pk)
+        for cols, index in self.unique.items():
+            values = tuple(row.get(c) for c in cols)
+            if add:
+                index[values] = pk
+            elif index.get(values) == pk:
+                del index[values]
+
+    def find_conflict(self, row, cols=None):
+        cols = tuple(cols) if cols else self.pk
+        if cols == self.pk:
+            key = self.key(row) if all(c in row for c in cols) else None
+            return key if key in self.rows else None
+        return self.unique.get(cols, {}).get(tuple(row.get(c) for c in cols))
+
+    def insert(self, row):
+        row = dict(row)
+        for col, default in self.defaults.items():
+            if col not in row:
+                row[col] = default() if callable(default) else default
+        if self.serial:
+            if row.get("id") is None:
+                row["id"] = self.next_id
+            self.next_id = max(self.next_id, row["id"] + 1)
+        if self.find_conflict(row) is not None or any(self.find_conflict(row, cols) is not None for cols in self.unique):
+            raise PgError("23505", f'duplicate key value violates unique constraint on "{self.name}"', 409)
+        pk = self.key(row)
+        self.rows[pk] = row
+        self._index(pk, row)
+        self.version += 1
+        return row
+
+    def update(self, pk, changes):
+        row = self.rows[pk]
+        self._index(pk, row, add=False)
+        row.update(changes)
+        self._index(pk, row)
+        self.version += 1
+        return row
+
+    def delete(self, pk):
+        row = self.rows.pop(pk)
+        self._index(pk, row, add=False)
+        self.version += 1
+        return row
+
+    def sort(self, pks, order):
+        pks = list(pks)
+        for col, desc in reversed(order):
+            # Como en Postgres: nulls last en asc y nulls first en desc.
+            pks.sort(key=lambda pk: (self.rows[pk].get(col) is None, self.rows[pk].get(col)), reverse=desc)
+        return pks
+
+    def sorted_pks(self, order):
+        cached = self._sorted.get(order)
+        if cached is None or cached[0] != self.version:
+            pks = list(self.rows) if order == (("id", False),) and self.serial else self.sort(self.rows, order)
+            cached = self._sorted[order] = (self.version, pks)
+        return cached[1]
+
+def _unquote(raw):
+    if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", raw[1:-1])
+    return raw
+
+def _coerce(raw, sample):
+    if isinstance(sample, bool):
+        # postgrest-py serializa True como "True"; Postgres acepta ambas formas.
+        return raw.lower() in ("true", "t", "1")
+    if isinstance(sample, (int, float)):
+        try:
+            return int(raw) if isinstance(sample, int) and raw.lstrip("-").isdigit() else float(raw)
+        except ValueError:
+            # Como Postgres: un literal que no es número para una columna numérica es un 400.
+            raise PgError("22P02", f'invalid input syntax for type numeric: "{raw}"', 400)
+    return raw
+
+def _guess(raw):
+    raw = _unquote(raw)
+    if raw.lower() in ("true", "false"):
+        return raw.lower() == "true"
+    return int(raw) if raw.lstrip("-").isdigit() else raw
+
+def _split(text):
+    out, cur, depth, quoted, i = [], [], 0, False, 0
+    while i < len(text):
+        c = text[i]
+        if quoted:
+            cur.append(c)
+            if c == "\\" and i + 1 < len(text):
+                cur.append(text[i + 1]); i += 1
+            elif c == '"':
+                quoted = False
+        elif c == '"':
+            quoted = True; cur.append(c)
+        elif c in "()":
+            depth += 1 if c == "(" else -1; cur.append(c)
+        elif c == "," and depth == 0:
+            out.append("".join(cur)); cur = []
+        else:
+            cur.append(c)
+        i += 1
+    if cur:
+        out.append("".join(cur))
+    return out
+
+def _like(pattern, flags=0):
+    parts = (re.escape(p) for p in re.split(r"[*%]", pattern))
+    return re.compile("^" + ".*".join(parts) + "$", flags | re.S)
+
+def _compare(op, raw):
+    def test(value):
+        if value is None:
+            return None
+        other = _coerce(raw, value)
+        try:
+            return COMPARATORS[op](value, other)
+        except TypeError:
+            return COMPARATORS[op](str(value), str(other))
+    return test
+
+COMPARATORS = {
+    "eq": lambda a, b: a == b, "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b, "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b,
+}
+
+def _condition(col, expr):
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, raw = expr.partition(".")
+    if op in COMPARATORS:
+        test = _compare(op, _unquote(raw))
+    elif op == "is":
+        expected = {"null": None, "true": True, "false": False}[raw.lower()]
+        test = lambda v: v is expected
+    elif op == "in":
+        raws = [_unquote(x) for x in _split(raw[1:-1])]
+        test = lambda v: None if v is None else any(v == _coerce(x, v) for x in raws)
+    elif op in ("like", "ilike"):
+        pattern = _like(_unquote(raw), re.I if op == "ilike" else 0)
+        test = lambda v: None if v is None else bool(pattern.match(str(v)))
+    else:
+        raise PgError("PGRST100", f"operador no soportado por el emulador: {op}")
+
+    def predicate(row):
+        result = test(row.get(col))
+        return False if result is None else result != negate
+    predicate.index_hint = (col, op, raw) if not negate and op in ("eq", "in") else None
+    predicate.range_hint = (col, op, raw) if not negate and op in ("gt", "gte") else None
+    return predicate
+
+def _logic(kind, body, negate=False):
+    preds = [_item(x) for x in _split(body)]
+    combine = any if kind == "or" else all
+    predicate = lambda row: combine(p(row) for p in preds) != negate
+    predicate.index_hint = predicate.range_hint = None
+    return predicate
+
+def _item(item):
+    for kind in ("or", "and", "not.or", "not.and"):
+        if item.startswith(kind + "("):
+            return _logic(kind.removeprefix("not."), item[len(kind) + 1:-1], kind.startswith("not."))
+    col, _, expr = item.partition(".")
+    return _condition(col, expr)
+
+def parse_select(text):
+    cols, embeds = [], []
+    for item in _split(text or "*"):
+        item = item.strip()
+        if "(" in item:
+            head, inner = item[:-1].split("(", 1)
+            name, _, hint = head.partition("!")
+            sub_cols, sub_embeds = parse_select(inner)
+            embeds.append({"name": name, "inner": hint == "inner", "cols": sub_cols, "embeds": sub_embeds, "filters": []})
+        elif item:
+            cols.append(item)
+    return cols, embeds
+
+class FakeSupabase:
+    """PostgREST + Storage en memoria para los benchmarks.
+
+    Entiende el subconjunto de la API que usa la tienda (select con embeds,
+    filtros, or/and, order, limit/offset/Range, object+json, insert/upsert,
+    update, delete y las funciones RPC del SQL) y añade latencia por llamada.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.RLock()
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.busy = 0.0
+        self.storage = {}
+        self._memo = {}
+        tables = [
+            Table("products", indexes=("active",), unique=(("slug",),), defaults={"active": True, "image_variants": False, "stock": 0, "description": None, "image_path": None, "image_version": None}),
+            Table("categories", unique=(("slug",),)),
+            Table("product_categories", pk=("product_id", "category_id"), indexes=("product_id", "category_id")),
+            Table("admins", pk=("user_id",), defaults={"created_at": now_iso}),
+            Table("carts", indexes=("user_id",), unique=(("user_id",),), defaults={"id": lambda: str(uuid.uuid4()), "created_at": now_iso}, serial=False),
+            Table("cart_items", indexes=("cart_id", "product_id"), unique=(("cart_id", "product_id"),), defaults={"qty": 1, "price_at_add": None}),
+            Table("addresses", indexes=("user_id",), defaults={"country": "GT", "is_default": False, "created_at": now_iso}),
+            Table("orders", indexes=("user_id",), defaults={"status": "pending", "total": 0, "currency": "GTQ", "payment_method": None, "payment_status": None, "gateway_ref": None, "address_snapshot": None, "created_at": now_iso}),
+            Table("order_items", indexes=("order_id",)),
+            Table("stock_reservations", indexes=("order_id",), defaults={"status": "held", "created_at": now_iso}),
+            Table("catalog_version", serial=False),
+        ]
+        self.tables = {t.name: t for t in tables}
+        self.tables["catalog_version"].insert({"id": True, "version": 0, "updated_at": now_iso()})
+        # (padre, hijo) -> cómo se resuelve el embed.
+        self.relations = {
+            ("orders", "order_items"): ("many", "order_id"),
+            ("order_items", "orders"): ("one", "order_id"),
+            ("carts", "cart_items"): ("many", "cart_id"),
+            ("cart_items", "products"): ("one", "product_id"),
+            ("products", "product_categories"): ("many", "product_id"),
+            ("product_categories", "products"): ("one", "product_id"),
+            ("product_categories", "categories"): ("one", "category_id"),
+            ("products", "categories"): ("m2m", "product_categories", "product_id", "category_id"),
+            ("categories", "products"): ("m2m", "product_categories", "category_id", "product_id"),
+        }
+
+    def load(self, table, rows):
+        t = self.tables[table]
+        with self.lock:
+            for row in rows:
+                t.insert(row)
+
+    def transport(self):
+        return FakeTransport(self)
+
+    # --- lectura ---------------------------------------------------------
+
+    def _related(self, parent, row, embed):
+        kind, *spec = self.relations[(parent, embed["name"])]
+        child = self.tables[embed["name"]]
+        if kind == "many":
+            rows = [child.rows[pk] for pk in child.lookup(spec[0], row["id"])]
+        elif kind == "one":
+            target = child.rows.get(row.get(spec[0]))
+            rows = [target] if target else []
+        else:
+            junction = self.tables[spec[0]]
+            links = (junction.rows[pk] for pk in junction.lookup(spec[1], row["id"]))
+            rows = [child.rows[link[spec[2]]] for link in links if link[spec[2]] in child.rows]
+        rows = [r for r in rows if all(f(r) for f in embed["filters"])]
+        return kind, rows
+
+    def _project(self, table, row, cols, embeds):
+        out = dict(row) if "*" in cols or not cols else {c: row.get(c) for c in cols}
+        for embed in embeds:
+            kind, rows = self._related(table, row, embed)
+            projected = [self._project(embed["name"], r, embed["cols"], embed["embeds"]) for r in rows]
+            out[embed["name"]] = (projected[0] if projected else None) if kind == "one" else projected
+        return out
+
+    def _passes_inner(self, table, row, embeds):
+        return all(self._related(table, row, e)[1] for e in embeds if e["inner"])
+
+    def _parse_query(self, params):
+        cols, embeds = parse_select(params.get("select"))
+        by_name = {e["name"]: e for e in embeds}
+        filters, order, limit, offset = [], [], None, 0
+        for key, value in params.multi_items():
+            if key in ("select", "on_conflict", "columns"):
+                continue
+            if key == "order":
+                for part in value.split(","):
+                    col, *mods = part.split(".")
+                    order.append((col, "desc" in mods))
+            elif key == "limit":
+                limit = int(value)
+            elif key == "offset":
+                offset = int(value)
+            elif key in ("or", "and", "not.or", "not.and"):
+                filters.append(_logic(key.removeprefix("not."), value[1:-1], key.startswith("not.")))
+            elif "." in key:
+                name, _, rest = key.partition(".")
+                if name in by_name and rest not in ("order", "limit", "offset"):
+                    by_name[name]["filters"].append(_condition(rest, value))
+            else:
+                filters.append(_condition(key, value))
+        return cols, embeds, filters, tuple(order), limit, offset
+
+    def _candidates(self, table, filters):
+        best = None
+        for f in filters:
+            hint = f.index_hint
+            if not hint:
+                continue
+            col, op, raw = hint
+            if col not in table.indexes and not (len(table.pk) == 1 and col == table.pk[0]):
+                continue
+            values = [_guess(x) for x in _split(raw[1:-1])] if op == "in" else [_guess(raw)]
+            pks = set()
+            for v in values:
+                pks |= table.lookup(col, v)
+                if isinstance(v, int) and not isinstance(v, bool):
+                    pks |= table.lookup(col, str(v))
+            if best is None or len(pks) < len(best):
+                best = pks
+        return best
+
+    def _range_start(self, table, filters, order, ordered):
+        # Como un index range scan sobre la pk: "id > N order by id" (keyset) no
+        # recorre las filas anteriores a N.
+        if order != ((table.pk[0], False),) or not table.serial:
+            return 0
+        start = 0
+        for f in filters:
+            hint = getattr(f, "range_hint", None)
+            if hint and hint[0] == table.pk[0]:
+                try:
+                    bound = int(hint[2])
+                except ValueError:
+                    continue
+                start = max(start, (bisect_right if hint[1] == "gt" else bisect_left)(ordered, bound))
+        return start
+
+    def _inner_candidates(self, table, embeds):
+        # Como haría Postgres con índices: resuelve primero el lado filtrado del join.
+        best = None
+        for e in embeds:
+            if not (e["inner"] and e["filters"]):
+                continue
+            kind, *spec = self.relations[(table.name, e["name"])]
+            if kind == "one":
+                continue
+            child = self.tables[e["name"]]
+            pks = self._candidates(child, e["filters"])
+            rows = [child.rows[pk] for pk in (child.rows if pks is None else pks)]
+            matches = [r for r in rows if all(f(r) for f in e["filters"])]
+            if kind == "many":
+                parents = {r[spec[0]] for r in matches}
+            else:
+                junction = self.tables[spec[0]]
+                parents = {junction.rows[pk][spec[1]] for r in matches for pk in junction.lookup(spec[2], r["id"])}
+            best = parents if best is None else best & parents
+        return best
+
+    def _matching(self, table, params, need_all=False):
+        cols, embeds, filters, order, limit, offset = self._parse_query(params)
+        pks = self._candidates(table, filters)
+        inner = self._inner_candidates(table, embeds)
+        if inner is not None:
+            pks = inner if pks is None else pks & inner
+        if pks is not None:
+            ordered = table.sort(pks, order or ((table.pk[0], False),))
+        elif order:
+            ordered = table.sorted_pks(order)
+            start = self._range_start(table, filters, order, ordered)
+            if start:
+                ordered = islice(ordered, start, None)
+        else:
+            ordered = list(table.rows)
+        plain = not filters and not any(e["inner"] for e in embeds)
+        if plain and not need_all:
+            window = ordered[offset:offset + limit if limit is not None else None]
+            return cols, embeds, [table.rows[pk] for pk in window], len(ordered), offset
+        matched = []
+        stop = None if need_all or limit is None else offset + limit
+        for pk in ordered:
+            row = table.rows[pk]
+            if all(f(row) for f in filters) and self._passes_inner(table.name, row, embeds):
+                matched.append(row)
+                if stop is not None and len(matched) >= stop:
+                    break
+        window = matched[offset:offset + limit if limit is not None else None]
+        return cols, embeds, window, len(matched), offset
+
+    # --- HTTP ------------------------------------------------------------
+
+    def handle(self, request: httpx.Request):
+        path = unquote(request.url.path)
+        if path.startswith("/rest/v1/rpc/"):
+            fn = getattr(self, "rpc_" + path.rsplit("/", 1)[1], None)
+            if fn is None:
+                raise PgError("PGRST202", f"función desconocida: {path}", 404)
+            body = request.read()
+            return 200, {}, fn(**(json.loads(body) if body else {}))
+        if path.startswith("/rest/v1/"):
+            return self._rest(path.split("/")[3], request)
+        if path.startswith("/storage/v1/object/"):
+            return self._storage(path[len("/storage/v1/object/"):], request)
+        raise PgError("404", f"ruta no emulada: {path}", 404)
+
+    def _rest(self, name, request):
+        table = self.tables.get(name)
+        if table is None:
+            raise PgError("42P01", f'relation "public.{name}" does not exist', 404)
+        params = request.url.params
+        prefer = request.headers.get("prefer", "")
+        method = request.method
+        if method in ("GET", "HEAD"):
+            rng = request.headers.get("range")
+            if rng and "limit" not in params:
+                start, _, end = rng.partition("-")
+                params = params.set("offset", start).set("limit", str(int(end) - int(start) + 1))
+            counting = "count=" in prefer
+            cols, embeds, rows, total, offset = self._matching(table, params, need_all=counting)
+            data = [self._project(name, r, cols, embeds) for r in rows]
+            headers = {}
+            if counting:
+                headers["content-range"] = f"{offset}-{offset + len(data) - 1}/{total}" if data else f"*/{total}"
+            return self._shape(request, data, headers)
+        body = request.read()
+        payload = json.loads(body) if body else None
+        if method == "POST":
+            rows = payload if isinstance(payload, list) else [payload]
+            out = []
+            conflict = params.get("on_conflict")
+            conflict = tuple(conflict.split(",")) if conflict else table.pk
+            for row in rows:
+                if "resolution=" in prefer:
+                    pk = table.find_conflict(row, conflict)
+                    if pk is not None:
+                        if "resolution=merge-duplicates" in prefer:
+                            out.append(table.update(pk, row))
+                        continue
+                out.append(table.insert(row))
+            self._bump_catalog_version(name, method, payload)
+            return self._written(request, out, 201)
+        _, _, rows, _, _ = self._matching(table, params, need_all=True)
+        pks = [table.key(r) for r in rows]
+        if method == "PATCH":
+            out = [dict(table.update(pk, payload)) for pk in pks]
+        elif method == "DELETE":
+            out = [table.delete(pk) for pk in pks]
+        else:
+            raise PgError("405", f"método no soportado: {method}", 405)
+        self._bump_catalog_version(name, method, payload)
+        return self._written(request, out, 200)
+
+    def _bump_catalog_version(self, name, method, payload):
+        # Los triggers *_catalog_version, por sentencia; un update de products
+        # que solo cambia el stock no la sube.
+        if name not in ("products", "categories", "product_categories"):
+            return
+        if name == "products" and method == "PATCH" and set(payload or {}) <= {"stock"}:
+            return
+        version = self.tables["catalog_version"]
+        version.update(True, {"version": version.rows[True]["version"] + 1, "updated_at": now_iso()})
+
+    def _written(self, request, rows, status):
+        if "return=minimal" in request.headers.get("prefer", ""):
+            return 204 if status == 200 else status, {}, None
+        cols, _ = parse_select(request.url.params.get("select"))
+        return status, {}, [self._project(None, r, cols, []) for r in rows]
+
+    def _shape(self, request, data, headers):
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(data) != 1:
+                raise PgError("PGRST116", "JSON object requested, multiple (or no) rows returned", 406,
+                              f"The result contains {len(data)} rows")
+            return 200, headers, data[0]
+        return 200, headers, data
+
+    def _storage(self, rest, request):
+        if request.method in ("POST", "PUT"):
+            self.storage[rest] = len(request.read())
+            return 200, {}, {"Key": rest}
+        if request.method == "DELETE":
+            return 200, {}, []
+        if rest.removeprefix("public/") in self.storage:
+            return 200, {}, {}
+        raise PgError("404", "Object not found", 404)
+
+    # --- RPC (equivalentes a SQL_SUPABASE.sql) ---------------------------
+
+    def _cart_id(self, user_id):
+        carts = self.tables["carts"]
+        pks = carts.lookup("user_id", user_id)
+        return next(iter(pks)) if pks else carts.insert({"user_id": user_id})["id"]
+
+    def rpc_cart_with_products(self, p_user_id):
+        cart_id = self._cart_id(p_user_id)
+        items, products = self.tables["cart_items"], self.tables["products"]
+        lines = []
+        for pk in sorted(items.lookup("cart_id", cart_id)):
+            ci = items.rows[pk]
+            p = products.rows.get(ci["product_id"]) or {}
+            price = round(float(p.get("price") if p.get("price") is not None else ci.get("price_at_add") or 0), 2)
+            lines.append({
+                "id": ci["id"], "product_id": ci["product_id"], "qty": ci["qty"], "price_at_add": ci.get("price_at_add"),
+                "price": price, "subtotal": round(price * (ci.get("qty") or 1), 2),
+                "product": {k: p.get(k) for k in ("id", "name", "slug", "price", "stock", "image_path", "image_version", "image_variants")},
+            })
+        return {"cart_id": cart_id, "items": lines, "total": round(sum(l["subtotal"] for l in lines), 2)}
+
+    def rpc_merge_guest_cart(self, p_user_id, p_items):
+        cart_id = self._cart_id(p_user_id)
+        items, products = self.tables["cart_items"], self.tables["products"]
+        for line in p_items:
+            p = products.rows.get(line["product_id"])
+            if not p or not p["active"] or line["qty"] <= 0:
+                continue
+            row = {"cart_id": cart_id, "product_id": p["id"]}
+            pk = items.find_conflict(row, ("cart_id", "product_id"))
+            if pk is None:
+                items.insert({**row, "qty": line["qty"], "price_at_add": p["price"]})
+            else:
+                items.update(pk, {"qty": items.rows[pk]["qty"] + line["qty"]})
+        return {"cart_id": cart_id, "count": len(items.lookup("cart_id", cart_id))}
+
+    def rpc_create_order_with_items(self, p_user_id, p_total, p_currency, p_payment_method, p_address, p_items):
+        order = self.tables["orders"].insert({
+            "user_id": p_user_id, "status": "pending", "total": p_total, "currency": p_currency,
+            "payment_method": p_payment_method, "payment_status": "unpaid", "address_snapshot": p_address,
+        })
+        for i in p_items:
+            self.tables["order_items"].insert({"order_id": order["id"], **{k: i.get(k) for k in ("product_id", "name", "price", "qty", "subtotal")}})
+        self.rpc_release_expired_reservations()
+        self._reserve_stock(order, p_items)
+        return dict(order)
+
+    def _reserve_stock(self, order, items):
+        products, reservations = self.tables["products"], self.tables["stock_reservations"]
+        wanted = {}
+        for i in items:
+            wanted[int(i["product_id"])] = wanted.get(int(i["product_id"]), 0) + int(i["qty"])
+        for pid in sorted(wanted):
+            p = products.rows.get(pid)
+            if not p or (p.get("stock") or 0) < wanted[pid]:
+                # Postgres revierte toda la transacción.
+                for pk in list(self.tables["order_items"].lookup("order_id", order["id"])):
+                    self.tables["order_items"].delete(pk)
+                for pk in list(reservations.lookup("order_id", order["id"])):
+                    r = reservations.delete(pk)
+                    products.update(r["product_id"], {"stock": products.rows[r["product_id"]]["stock"] + r["qty"]})
+                self.tables["orders"].delete(order["id"])
+                raise PgError("P0001", f"insufficient_stock:{pid}")
+            products.update(pid, {"stock": p["stock"] - wanted[pid]})
+            reservations.insert({"order_id": order["id"], "product_id": pid, "qty": wanted[pid],
+                                 "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=30)).isoformat()})
+
+    def _release(self, pks):
+        products, reservations = self.tables["products"], self.tables["stock_reservations"]
+        touched = set()
+        for pk in pks:
+            r = reservations.update(pk, {"status": "released"})
+            p = products.rows.get(r["product_id"])
+            if p:
+                products.update(p["id"], {"stock": p["stock"] + r["qty"]})
+                touched.add(p["id"])
+        return len(touched)
+
+    def rpc_release_stock(self, p_order_id):
+        reservations = self.tables["stock_reservations"]
+        return self._release([pk for pk in reservations.lookup("order_id", p_order_id) if reservations.rows[pk]["status"] == "held"])
+
+    def rpc_release_expired_reservations(self):
+        reservations, now = self.tables["stock_reservations"], now_iso()
+        return self._release([pk for pk, r in reservations.rows.items() if r["status"] == "held" and r["expires_at"] < now])
+
+    def rpc_commit_stock(self, p_order_id):
+        products, reservations = self.tables["products"], self.tables["stock_reservations"]
+        short = 0
+        for pk in sorted(reservations.lookup("order_id", p_order_id), key=lambda pk: reservations.rows[pk]["product_id"]):
+            r = reservations.rows[pk]
+            if r["status"] == "released":
+                p = products.rows.get(r["product_id"])
+                if not p or p["stock"] < r["qty"]:
+                    short += 1
+                    continue
+                products.update(p["id"], {"stock": p["stock"] - r["qty"]})
+            if r["status"] in ("held", "released"):
+                reservations.update(pk, {"status": "committed"})
+        return short
+
+    def _search_text(self):
+        products = self.tables["products"]
+        cached = self._memo.get("search")
+        if cached is None or cached[0] != products.version:
+            cached = self._memo["search"] = (products.version, {
+                pk: (_fold(r.get("name")).split(), _fold(r.get("description")).split()) for pk, r in products.rows.items()
+            })
+        return cached[1]
+
+    def rpc_search_products(self, q, category_slug=None, lim=24, off=0):
+        terms = [t for t in re.split(r"[^a-z0-9]+", _fold(q)) if t]
+        products = self.tables["products"]
+        allowed = None
+        if category_slug:
+            cat = self.tables["categories"].unique[("slug",)].get((category_slug,))
+            links = self.tables["product_categories"]
+            allowed = {links.rows[pk]["product_id"] for pk in links.lookup("category_id", cat)} if cat is not None else set()
+        hits = []
+        for pk, (name, desc) in self._search_text().items():
+            row = products.rows[pk]
+            if not terms or row.get("active") is False or (allowed is not None and pk not in allowed):
+                continue
+            rank = 0.0
+            for t in terms:
+                score = sum(1.0 for w in name if w.startswith(t)) + sum(0.4 for w in desc if w.startswith(t))
+                if not score:
+                    break
+                rank += score
+            else:
+                hits.append((-rank, row.get("name") or "", pk))
+        hits.sort()
+        fields = ("id", "name", "slug", "price", "stock", "image_path", "image_version", "image_variants", "active")
+        items = [{k: products.rows[pk].get(k) for k in fields} for _, _, pk in hits[off:off + lim]]
+        return {"total": len(hits), "items": items}
+
+    def rpc_refresh_dashboard_metrics(self, p_max_age="0 seconds"):
+        # rpc_dashboard_metrics ya calcula los más vendidos al momento.
+        return False
+
+    def rpc_dashboard_metrics(self):
+        # En Postgres lo mantienen triggers; aquí se recalcula solo si cambiaron las órdenes.
+        orders, items = self.tables["orders"], self.tables["order_items"]
+        key = (orders.version, items.version, len(self.tables["products"].rows), len(self.tables["categories"].rows))
+        cached = self._memo.get("dashboard")
+        if cached and cached[0] == key:
+            return cached[1]
+        by_status, revenue, top = {}, {}, {}
+        since = (datetime.now(timezone.utc) - timedelta(days=30)).date().isoformat()
+        for o in orders.rows.values():
+            k = (o["status"], o.get("payment_status") or "")
+            by_status[k] = by_status.get(k, 0) + 1
+            if o.get("payment_status") == "paid":
+                day = str(o.get("created_at"))[:10]
+                if day > since:
+                    d = revenue.setdefault(day, {"day": day, "orders": 0, "revenue": 0.0})
+                    d["orders"] += 1; d["revenue"] += float(o.get("total") or 0)
+                for pk in items.lookup("order_id", o["id"]):
+                    i = items.rows[pk]
+                    t = top.setdefault(i["product_id"], {"product_id": i["product_id"], "name": i.get("name"), "units": 0, "revenue": 0.0})
+                    t["units"] += i.get("qty") or 0; t["revenue"] += float(i.get("subtotal") or 0)
+        result = {
+            "counts": {"products": len(self.tables["products"].rows), "categories": len(self.tables["categories"].rows), "orders": len(orders.rows)},
+            "by_status": sorted(({"status": s, "payment_status": p, "orders": n} for (s, p), n in by_status.items()), key=lambda r: -r["orders"]),
+            "revenue_daily": sorted(revenue.values(), key=lambda r: r["day"], reverse=True),
+            "top_products": sorted(top.values(), key=lambda r: -r["units"])[:10],
+            "top_products_age": 0,
+        }
+        self._memo["dashboard"] = (key, result)
+        return result
+
+class FakeTransport(httpx.BaseTransport):
+    def __init__(self, db: FakeSupabase):
+        self.db = db
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self.db.lock:
+            start = time.perf_counter()
+            try:
+                status, headers, data = self.db.handle(request)
+            except PgError as e:
+                status, headers, data = e.status, {}, e.body()
+            busy = time.perf_counter() - start
+            self.db.calls += 1
+            self.db.busy += busy
+        trips = request_trips.get()
+        if trips is not None:
+            trips[0] += 1
+            trips[1] += busy
+        if self.db.latency or self.db.jitter:
+            time.sleep(self.db.latency + self.db.rng.uniform(0, self.db.jitter))
+        content = b"" if data is None else json.dumps(data, default=str).encode()
+        return httpx.Response(status, headers={"content-type": "application/json", **headers}, content=content, request=request)
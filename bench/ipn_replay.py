@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+from collections import defaultdict
+from bench.fake_supabase import FakeSupabase, PgError
+from bench.seed import seed
+from bench.run import boot
+
+# Reproduce una tanda de notificaciones de Pagadito contra el Supabase en
+# memoria: duplicados, reenvíos con otro txid, un "failed" seguido de "paid",
+# un "failed" que llega después del "paid" y fallos transitorios de commit_stock.
+# Encola todo por /payments/pagadito/ipn, drena la cola con ipn.process_one()
+# y comprueba el estado final de orders, stock_reservations y products.
+
+# (notificaciones en orden de llegada por orden, estado final esperado)
+SCRIPTS = {
+    "pagado": ([("paid", "A")], "paid"),
+    "duplicado": ([("paid", "A"), ("paid", "A"), ("paid", "B")], "paid"),
+    "fallido": ([("failed", "A")], "failed"),
+    "fallido dos veces": ([("failed", "A"), ("failed", "B")], "failed"),
+    "fallido y luego pagado": ([("failed", "A"), ("paid", "B")], "paid"),
+    "fallo atrasado": ([("paid", "B"), ("failed", "A")], "paid"),
+    "reintento": ([("paid", "A"), ("failed", "B")], "paid"),
+    "agotado tras fallo": ([("failed", "A"), ("paid", "B")], "backorder"),
+}
+# commit_stock falla la primera vez para estas órdenes: la notificación
+# siguiente de la misma orden tiene que esperar al reintento.
+FLAKY = {"reintento"}
+# Otro comprador se lleva las unidades que libera el "failed": el "paid" posterior
+# no puede volver a descontarlas y la orden queda como backorder.
+SOLD_OUT = {"agotado tras fallo"}
+EXPECTED_STATE = {"paid": ("paid", "paid"), "failed": ("pending", "failed"), "backorder": ("backorder", "paid")}
+EXPECTED_RESERVATIONS = {"paid": "committed", "failed": "released", "backorder": "released"}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduce notificaciones IPN y comprueba el estado final.")
+    parser.add_argument("--orders", type=int, default=20, help="órdenes por guion")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    # Sin hilos de IPN (se drena a mano) y con un backoff corto, pero no nulo:
+    # mientras una notificación espera su reintento, las siguientes ya son elegibles.
+    os.environ.update({"IPN_WORKERS": "0", "IPN_RETRY_BACKOFF": "0.01"})
+    db = FakeSupabase(0, 0)
+    ctx = seed(db, "1k", args.seed)
+    app = boot(db, "memory")
+    import ipn
+    # Los fallos transitorios inyectados ya se cuentan abajo.
+    logging.getLogger("ipn").setLevel(logging.ERROR)
+    client = app.test_client()
+    products, reservations = db.tables["products"], db.tables["stock_reservations"]
+    stock_before = {pid: products.rows[pid]["stock"] for pid in ctx.in_stock}
+
+    # Los productos de SOLD_OUT no se comparten con otras órdenes.
+    sold_out = set(rng.sample(ctx.in_stock, 3 * args.orders))
+    shared = [pid for pid in ctx.in_stock if pid not in sold_out]
+    sold_out_pool, sold_out_used = sorted(sold_out), set()
+    orders = {}
+    for name in SCRIPTS:
+        for _ in range(args.orders):
+            if name in SOLD_OUT:
+                pids = [sold_out_pool.pop() for _ in range(rng.randint(1, 3))]
+                sold_out_used.update(pids)
+            else:
+                pids = rng.sample(shared, rng.randint(1, 3))
+            items = [{"product_id": pid, "name": "x", "price": 1, "qty": rng.randint(1, 3), "subtotal": 1} for pid in pids]
+            order = db.rpc_create_order_with_items(rng.choice(ctx.users), 1, "GTQ", "pagadito", {}, items)
+            orders[order["id"]] = name
+
+    flaky = {oid for oid, name in orders.items() if name in FLAKY}
+    commit_stock = db.rpc_commit_stock
+
+    def flaky_commit_stock(p_order_id):
+        if p_order_id in flaky:
+            flaky.discard(p_order_id)
+            raise PgError("08006", "conexión perdida", 503)
+        return commit_stock(p_order_id)
+    db.rpc_commit_stock = flaky_commit_stock
+
+    release_stock = db.rpc_release_stock
+
+    def release_and_sell(p_order_id):
+        count = release_stock(p_order_id)
+        if orders.get(p_order_id) in SOLD_OUT:
+            for pk in reservations.lookup("order_id", p_order_id):
+                products.update(reservations.rows[pk]["product_id"], {"stock": 0})
+        return count
+    db.rpc_release_stock = release_and_sell
+
+    applied = defaultdict(list)
+    apply_payment = ipn.apply_payment
+
+    def recording_apply_payment(order_id, status, gateway_ref=None):
+        apply_payment(order_id, status, gateway_ref)
+        applied[order_id].append((status, gateway_ref))
+    ipn.apply_payment = recording_apply_payment
+
+    # Entrega intercalada entre órdenes, cada una en el orden de su guion.
+    pending = {oid: [(status, f"TX{oid}-{txid}") for status, txid in SCRIPTS[name][0]] for oid, name in orders.items()}
+    while pending:
+        oid = rng.choice(list(pending))
+        status, txid = pending[oid].pop(0)
+        r = client.post("/payments/pagadito/ipn", data={"reference": f"ORDER-{oid}", "status": status, "txid": txid})
+        if r.status_code != 200:
+            sys.exit(f"IPN de la orden {oid} respondió {r.status_code}")
+        if not pending[oid]:
+            del pending[oid]
+
+    processed = 0
+    deadline = time.monotonic() + 30
+    while ipn.queue_stats()["pending"] and time.monotonic() < deadline:
+        if ipn.process_one():
+            processed += 1
+        else:
+            time.sleep(0.01)
+
+    errors = []
+    stats = ipn.queue_stats()
+    if stats["pending"] or stats["failed"]:
+        errors.append(f"cola sin drenar: {stats}")
+    committed = defaultdict(int)
+    for oid, name in orders.items():
+        script, expected = SCRIPTS[name]
+        order = db.tables["orders"].rows[oid]
+        want = EXPECTED_STATE[expected]
+        if (order["status"], order["payment_status"]) != want:
+            errors.append(f"orden {oid} ({name}): {order['status']}/{order['payment_status']}, se esperaba {want[0]}/{want[1]}")
+        # Los duplicados con el mismo txid se descartan al encolar; el resto se aplica en orden de llegada.
+        deduped = list(dict.fromkeys((status, f"TX{oid}-{txid}") for status, txid in script))
+        if applied[oid] != deduped:
+            errors.append(f"orden {oid} ({name}): aplicadas {applied[oid]}, se esperaba {deduped}")
+        states = {reservations.rows[pk]["status"] for pk in reservations.lookup("order_id", oid)}
+        if states != {EXPECTED_RESERVATIONS[expected]}:
+            errors.append(f"orden {oid} ({name}): reservas {sorted(states)}")
+        for pk in reservations.lookup("order_id", oid):
+            r = reservations.rows[pk]
+            if r["status"] == "committed":
+                committed[r["product_id"]] += r["qty"]
+    for pid, before in stock_before.items():
+        after = products.rows[pid]["stock"]
+        want = 0 if pid in sold_out_used else before - committed[pid]
+        if after != want:
+            errors.append(f"producto {pid}: stock {after}, se esperaba {want}")
+
+    by_name = defaultdict(int)
+    for name in orders.values():
+        by_name[name] += 1
+    print(f"{len(orders)} órdenes, {processed} notificaciones procesadas (incluye reintentos), cola {stats}")
+    for name, (script, expected) in SCRIPTS.items():
+        print(f"  {name:<24}{by_name[name]:>4} órdenes  {' → '.join(s for s, _ in script):<24} final {expected}")
+    if errors:
+        print("\n".join(errors[:20]))
+        sys.exit(f"{len(errors)} discrepancias")
+    print("estado final de orders, stock_reservations y products correcto")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import re
+import sys
+import argparse
+from bench.fake_supabase import FakeSupabase
+from bench.seed import seed
+from bench.run import boot, bench_env
+
+# Bytes que descarga el navegador por página del catálogo: la grilla con las
+# variantes que elegiría según srcset/sizes frente a servir el original.
+# Requiere Pillow, igual que la generación de variantes.
+
+VIEWPORTS = (("móvil", 390, 3), ("tableta", 820, 2), ("escritorio", 1440, 1), ("escritorio 2x", 1440, 2))
+SOURCE_RE = re.compile(r'<source type="image/webp" srcset="([^"]*)" sizes="([^"]*)"')
+IMG_RE = re.compile(r'<img src="([^"]*)"(?: srcset="([^"]*)" sizes="([^"]*)")?')
+MEDIA_RE = re.compile(r"\(min-width:\s*(\d+)px\)\s*(\d+)vw")
+
+def originals(count: int, size: int):
+    # Fotos sintéticas con degradados y ruido: comprimen como una foto de producto, no como un color plano.
+    from PIL import Image
+    import io
+    out = []
+    for i in range(count):
+        base = Image.radial_gradient("L").resize((size, size))
+        noise = Image.effect_noise((size, size), 24 + 8 * i)
+        img = Image.merge("RGB", (base, Image.blend(base, noise, 0.3), noise.rotate(90 * i)))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=90)
+        out.append(buf.getvalue())
+    return out
+
+def slot_width(sizes: str, viewport: int) -> float:
+    for part in sizes.split(","):
+        m = MEDIA_RE.search(part)
+        if m and viewport >= int(m.group(1)):
+            return viewport * int(m.group(2)) / 100
+        if not m:
+            return viewport * float(part.strip().rstrip("vw")) / 100
+    return viewport
+
+def pick(srcset: str, needed: float) -> str:
+    # Como el navegador: la candidata más pequeña que cubre el ancho necesario, o la mayor.
+    candidates = sorted((int(w.rstrip("w")), url) for url, w in (c.strip().rsplit(" ", 1) for c in srcset.split(",")))
+    return next((url for w, url in candidates if w >= needed), candidates[-1][1])
+
+def variant_of(url: str):
+    path = url.split("?", 1)[0].rsplit("/", 1)[-1]
+    base, variant, ext = path.rsplit(".", 2)
+    return base, variant, ext
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes de imágenes por página del catálogo, variantes frente a originales.")
+    parser.add_argument("--originals", type=int, default=4, help="fotos sintéticas distintas")
+    parser.add_argument("--original-px", type=int, default=3000, help="lado de la foto original subida")
+    parser.add_argument("--jpeg-only", action="store_true", help="navegador sin WebP (usa el srcset del <img>)")
+    args = parser.parse_args(argv)
+
+    # images importa core, que lee la configuración al importarse.
+    os.environ.update(bench_env())
+    try:
+        from images import render_variants
+        photos = originals(args.originals, args.original_px)
+    except ImportError:
+        sys.exit("Falta Pillow: pip install Pillow")
+    sizes = []
+    for data in photos:
+        rendered = {(variant, ext): len(body) for variant, ext, body, _ in render_variants(data)}
+        rendered["original"] = len(data)
+        sizes.append(rendered)
+
+    db = FakeSupabase(0, 0)
+    seed(db, "1k")
+    products = db.tables["products"]
+    photo_of = {}
+    for pid in list(products.rows):
+        slug = products.rows[pid]["slug"]
+        products.update(pid, {"image_path": f"{slug}.jpg", "image_version": 1, "image_variants": True})
+        photo_of[slug] = sizes[pid % len(sizes)]
+    page = boot(db, "memory").test_client().get("/")
+    body = page.get_data(as_text=True)
+    webp = SOURCE_RE.findall(body)
+    imgs = IMG_RE.findall(body)
+
+    print(f"página: {len(body.encode())} bytes de HTML, {len(imgs)} imágenes, originales de {args.original_px}px "
+          f"(media {sum(s['original'] for s in sizes) // len(sizes) // 1024} KB)")
+    print(f"{'viewport':<16}{'antes KB':>12}{'después KB':>12}{'ahorro':>10}")
+    for label, width, dpr in VIEWPORTS:
+        before = after = 0
+        for i, (src, srcset, sizes_attr) in enumerate(imgs):
+            base = variant_of(src)[0]
+            photo = photo_of[base]
+            before += photo["original"]
+            if args.jpeg_only or not webp:
+                chosen = pick(srcset, slot_width(sizes_attr, width) * dpr)
+            else:
+                chosen = pick(webp[i][0], slot_width(webp[i][1], width) * dpr)
+            _, variant, ext = variant_of(chosen)
+            after += photo[(variant, ext)]
+        print(f"{label:<16}{before / 1024:>12.0f}{after / 1024:>12.0f}{100 * (1 - after / before):>9.1f}%")
+
+if __name__ == "__main__":
+    main()
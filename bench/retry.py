@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import threading
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Comprueba RetryTransport y los hooks de _pooled contra un servidor HTTP local:
+# reintentos ante 502/503/504 solo en métodos idempotentes, backoff, el
+# presupuesto total por llamada y que los clientes que supabase-py recrea tras
+# un evento de auth sigan usando el transporte configurado.
+# Este módulo solo importa la biblioteca estándar antes de fijar la configuración.
+
+BACKOFF = 0.05
+ANON_KEY = "bench.anon.key"
+
+class Stub(BaseHTTPRequestHandler):
+    # /<fallos>/<status>/<espera_ms>/<nombre>: responde <status> las primeras
+    # <fallos> veces tras <espera_ms> y luego 200 con [] al instante, o al revés
+    # si <espera_ms> es negativa (falla al instante y tarda en responder bien).
+    hits = {}
+    lock = threading.Lock()
+
+    def _handle(self):
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        fails, status, wait_ms = int(parts[-4]), int(parts[-3]), int(parts[-2])
+        key = self.path.split("?", 1)[0]
+        with self.lock:
+            n = self.hits[key] = self.hits.get(key, 0) + 1
+        if (n <= fails) == (wait_ms > 0):
+            time.sleep(abs(wait_ms) / 1000)
+        body = json.dumps([] if n > fails else {"message": "stub"}).encode()
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200 if n > fails else status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    do_GET = do_POST = do_PATCH = _handle
+
+    def log_message(self, *args):
+        pass
+
+def _hits(path):
+    return Stub.hits.get(path, 0)
+
+def run_checks(base_url):
+    import httpx
+    import core
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append((name, ok, detail))
+
+    client = core._http_client(base_url, {}, 2)
+    started = time.monotonic()
+    r = client.get("/2/503/0/get-recupera")
+    elapsed = time.monotonic() - started
+    check("GET reintenta 503 hasta 200", r.status_code == 200 and _hits("/2/503/0/get-recupera") == 3,
+          f"status {r.status_code}, {_hits('/2/503/0/get-recupera')} intentos")
+    # Backoff con jitter entre 0.5x y 1.5x: BACKOFF * (1 + 2) como mínimo la mitad.
+    check("backoff exponencial entre intentos", elapsed >= BACKOFF * 3 * 0.5, f"{elapsed * 1000:.0f} ms")
+
+    for status in (502, 504):
+        path = f"/9/{status}/0/get-agota"
+        r = client.get(path)
+        check(f"GET {status} agota los reintentos", r.status_code == status and _hits(path) == 1 + core.SUPABASE_RETRIES,
+              f"status {r.status_code}, {_hits(path)} intentos")
+
+    r = client.get("/9/500/0/get-500")
+    check("GET 500 no se reintenta", r.status_code == 500 and _hits("/9/500/0/get-500") == 1, f"{_hits('/9/500/0/get-500')} intentos")
+
+    for method in ("POST", "PATCH"):
+        path = f"/9/503/0/{method.lower()}"
+        r = client.request(method, path, json={"a": 1})
+        check(f"{method} no se reintenta", r.status_code == 503 and _hits(path) == 1, f"{_hits(path)} intentos")
+
+    # Un puerto cerrado: los errores de conexión también se reintentan en GET.
+    closed = httpx.Client(base_url="http://127.0.0.1:9", transport=core.RetryTransport(httpx.HTTPTransport()), timeout=1)
+    started = time.monotonic()
+    try:
+        closed.get("/")
+        check("ConnectError se propaga tras los reintentos", False, "respondió")
+    except httpx.ConnectError:
+        check("ConnectError se propaga tras los reintentos", time.monotonic() - started >= BACKOFF * 3 * 0.5)
+
+    # Presupuesto: cada fallo tarda 300 ms; con 500 ms de presupuesto no cabe un tercer intento.
+    budgeted = httpx.Client(base_url=base_url, transport=core.RetryTransport(httpx.HTTPTransport(), budget=0.5), timeout=5)
+    started = time.monotonic()
+    try:
+        status = budgeted.get("/9/503/300/presupuesto").status_code
+    except httpx.ReadTimeout:
+        status = "timeout"
+    elapsed = time.monotonic() - started
+    check("el presupuesto corta los reintentos", elapsed < 0.5 + 0.15 and _hits("/9/503/300/presupuesto") <= 2,
+          f"{status}, {elapsed * 1000:.0f} ms, {_hits('/9/503/300/presupuesto')} intentos")
+    # El reintento hereda solo lo que queda del presupuesto, no el timeout completo del cliente.
+    started = time.monotonic()
+    try:
+        budgeted.get("/1/503/-2000/lento")
+        check("el reintento no supera el presupuesto", False, "respondió")
+    except httpx.ReadTimeout:
+        elapsed = time.monotonic() - started
+        check("el reintento no supera el presupuesto", elapsed < 0.5 + 0.15, f"{elapsed * 1000:.0f} ms")
+    check("presupuesto por defecto bajo el timeout de gunicorn", core.SUPABASE_RETRY_BUDGET < 30, f"{core.SUPABASE_RETRY_BUDGET} s")
+
+    # _pooled: el cliente de supabase-py usa RetryTransport, también tras recrear postgrest/storage.
+    sb = core.get_client("anon")
+    for round_ in ("inicial", "tras SIGNED_IN"):
+        transport = sb.postgrest.session._transport
+        inner = getattr(transport, "_transport", None)
+        check(f"postgrest usa RetryTransport ({round_})", isinstance(inner, core.RetryTransport), type(inner).__name__)
+        transport = sb.storage.session._transport
+        inner = getattr(transport, "_transport", None)
+        check(f"storage usa RetryTransport ({round_})", isinstance(inner, core.RetryTransport), type(inner).__name__)
+        sb._listen_to_auth_events("SIGNED_IN", None)
+    before = _hits("/rest/v1/1/503/0/pooled")
+    data = sb.table("1/503/0/pooled").select("*").execute().data
+    check("PostgREST a través de _pooled reintenta", data == [] and _hits("/rest/v1/1/503/0/pooled") - before == 2,
+          f"{_hits('/rest/v1/1/503/0/pooled')} intentos")
+    return checks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reintentos del transporte HTTP contra un servidor local.")
+    parser.parse_args(argv)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    # La configuración se lee al importar core.
+    os.environ.update({"SUPABASE_URL": base_url, "SUPABASE_ANON_KEY": ANON_KEY, "SUPABASE_SERVICE_ROLE_KEY": "",
+                       "SUPABASE_HTTP2": "0", "SUPABASE_BACKOFF": str(BACKOFF), "SUPABASE_RETRIES": "2"})
+    os.environ.pop("SUPABASE_RETRY_BUDGET", None)
+    try:
+        checks = run_checks(base_url)
+    finally:
+        server.shutdown()
+    failed = 0
+    for name, ok, detail in checks:
+        failed += not ok
+        print(f"{'ok ' if ok else 'FALLA'} {name}" + (f" ({detail})" if detail else ""))
+    if failed:
+        sys.exit(f"{failed} comprobaciones fallaron")
+
+if __name__ == "__main__":
+    main()
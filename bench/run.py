@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from bench.fake_supabase import FakeSupabase
+from bench.seed import SCALES, seed
+from bench.scenarios import SCENARIOS, Recorder, Worker
+
+def bench_env(search_backend: str = "memory") -> dict:
+    return {
+        "SUPABASE_URL": "http://supabase.bench",
+        "SUPABASE_ANON_KEY": "bench.anon.key",
+        "SUPABASE_SERVICE_ROLE_KEY": "bench.service.key",
+        "SUPABASE_HTTP2": "0",
+        "SECRET_KEY": "bench",
+        "PAYMENT_PROVIDER": "pagadito",
+        "SEARCH_BACKEND": search_backend,
+        "CACHE_REDIS_URL": "",
+        "IPN_QUEUE_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-ipn-"), "ipn.sqlite3"),
+    }
+
+def boot(db: FakeSupabase, search_backend: str):
+    # La configuración se lee al importar los módulos de la app, así que va primero.
+    os.environ.update(bench_env(search_backend))
+    import core
+    core._base_transport = db.transport
+    from app import create_app
+    app = create_app()
+    app.logger.setLevel(logging.ERROR)
+    return app
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+def summarize(samples, wall):
+    by_label = {}
+    for label, seconds, status, trips, busy, cpu, size in samples:
+        by_label.setdefault(label, []).append((seconds, status, trips, busy, cpu, size))
+    out = {}
+    for label, rows in by_label.items():
+        ms = [r[0] * 1000 for r in rows]
+        # Sin el tiempo de CPU del emulador, que a gran escala no se parece al de Postgres.
+        net = [(r[0] - r[3]) * 1000 for r in rows]
+        out[label] = {
+            "n": len(rows),
+            "errors": sum(1 for r in rows if r[1] >= 500),
+            "p50_ms": round(percentile(ms, 50), 2),
+            "p95_ms": round(percentile(ms, 95), 2),
+            "p99_ms": round(percentile(ms, 99), 2),
+            "mean_ms": round(sum(ms) / len(ms), 2),
+            "p50_net_ms": round(percentile(net, 50), 2),
+            "p95_net_ms": round(percentile(net, 95), 2),
+            "round_trips": round(sum(r[2] for r in rows) / len(rows), 2),
+            "fake_ms": round(sum(r[3] for r in rows) * 1000 / len(rows), 2),
+            # CPU del hilo que atendió la petición, sin la del emulador.
+            "cpu_ms": round(sum(max(0.0, r[4] - r[3]) for r in rows) * 1000 / len(rows), 2),
+            "bytes": round(sum(r[5] for r in rows) / len(rows)),
+            "rps": round(len(rows) / wall, 1) if wall else 0.0,
+        }
+    return out
+
+def run_scenario(app, ctx, name, iterations, concurrency, seed_value):
+    scenario = SCENARIOS[name]
+    # Calentamiento: índice de búsqueda, cachés y conexiones, fuera de la medición.
+    scenario(Worker(app, ctx, Recorder(), random.Random(seed_value), 0))
+    rec = Recorder()
+    per_worker = max(1, iterations // concurrency)
+
+    def work(i):
+        w = Worker(app, ctx, rec, random.Random(seed_value * 1000 + i), i)
+        for _ in range(per_worker):
+            scenario(w)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(work, range(concurrency)))
+    return summarize(rec.samples, time.perf_counter() - start)
+
+def print_table(results, baseline=None):
+    cols = ("n", "errors", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "p50_net_ms", "p95_net_ms", "round_trips", "fake_ms", "cpu_ms", "bytes", "rps")
+    print(f"{'request':<20}" + "".join(f"{c:>12}" for c in cols))
+    for label, stats in results.items():
+        line = f"{label:<20}" + "".join(f"{stats[c]:>12}" for c in cols)
+        base = (baseline or {}).get(label)
+        if base:
+            deltas = []
+            for c in ("p50_net_ms", "p95_net_ms", "round_trips"):
+                if base.get(c):
+                    deltas.append(f"{c} {100 * (stats[c] - base[c]) / base[c]:+.0f}%")
+            line += "   (" + ", ".join(deltas) + ")"
+        print(line)
+    full, revalidated = results.get("browse.index"), results.get("browse.revalidate")
+    if full and revalidated:
+        # Lo que se ahorra cada vez que un navegador o CDN revalida con el ETag.
+        print(f"revalidación (304 frente a 200): {full['bytes'] - revalidated['bytes']} bytes y "
+              f"{full['cpu_ms'] - revalidated['cpu_ms']:.2f} ms de CPU menos por petición, "
+              f"p50 {full['p50_net_ms'] - revalidated['p50_net_ms']:.2f} ms menos")
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la tienda contra un Supabase en memoria.")
+    parser.add_argument("--scale", choices=SCALES, default="1k")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="lista separada por comas")
+    parser.add_argument("--iterations", type=int, default=200, help="iteraciones por escenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latencia inyectada por llamada a Supabase")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--search-backend", choices=("memory", "postgres"), default="memory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="guarda los resultados en este JSON (p. ej. bench/results/baseline.json)")
+    parser.add_argument("--compare", help="JSON de resultados previos contra el que comparar")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(unknown)}")
+
+    db = FakeSupabase(args.latency_ms / 1000, args.jitter_ms / 1000, seed=args.seed)
+    started = time.perf_counter()
+    ctx = seed(db, args.scale, args.seed)
+    print(f"datos {args.scale}: {', '.join(f'{k}={len(t.rows)}' for k, t in db.tables.items())} ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    app = boot(db, args.search_backend)
+
+    results = {}
+    for name in names:
+        print(f"escenario {name}...", file=sys.stderr)
+        results.update(run_scenario(app, ctx, name, args.iterations, args.concurrency, args.seed))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        meta = {k: getattr(args, k) for k in ("scale", "iterations", "concurrency", "latency_ms", "jitter_ms", "search_backend", "seed")}
+        meta.update(revision=git_revision(), created_at=datetime.now(timezone.utc).isoformat())
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"resultados guardados en {args.save}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import io
+import re
+import csv
+import html
+import time
+from datetime import date, timedelta
+from urllib.parse import quote
+from bench.fake_supabase import request_trips
+from bench.seed import NOUNS, BRANDS, slug
+
+NEXT_RE = re.compile(r'href="([^"]*[?;]after=[^"]*)"')
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+
+    def request(self, client, label, method, url, **kwargs):
+        trips = [0, 0.0]
+        token = request_trips.set(trips)
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            resp = client.open(url, method=method, **kwargs)
+            size = len(resp.get_data())
+        finally:
+            elapsed, cpu = time.perf_counter() - start, time.thread_time() - cpu
+            request_trips.reset(token)
+        self.samples.append((label, elapsed, resp.status_code, trips[0], trips[1], cpu, size))
+        return resp
+
+    def call(self, label, fn):
+        # Para medir código de la app que no tiene ruta propia accesible desde el bench.
+        trips = [0, 0.0]
+        token = request_trips.set(trips)
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            fn()
+        finally:
+            elapsed, cpu = time.perf_counter() - start, time.thread_time() - cpu
+            request_trips.reset(token)
+        self.samples.append((label, elapsed, 200, trips[0], trips[1], cpu, 0))
+
+class Worker:
+    def __init__(self, app, ctx, recorder, rng, index):
+        self.client = app.test_client()
+        self.ctx = ctx
+        self.rec = recorder
+        self.rng = rng
+        # El usuario 0 es el admin; cada worker compra con su propio usuario.
+        self.user_id = ctx.users[1 + index % (len(ctx.users) - 1)]
+
+    def get(self, label, url, **kwargs):
+        return self.rec.request(self.client, label, "GET", url, **kwargs)
+
+    def post(self, label, url, **kwargs):
+        return self.rec.request(self.client, label, "POST", url, **kwargs)
+
+    def login(self, user_id=None):
+        uid = user_id or self.user_id
+        with self.client.session_transaction() as s:
+            s["user"] = {"id": uid, "email": f"{uid[:8]}@bench.local"}
+
+    def follow_next(self, label, resp):
+        m = NEXT_RE.search(resp.get_data(as_text=True))
+        if m:
+            self.get(label, html.unescape(m.group(1)))
+
+def _term(rng):
+    word = slug(rng.choice(NOUNS)).split("-")[0]
+    term = word[:rng.randint(3, len(word))] if len(word) > 3 else word
+    if rng.random() < 0.3:
+        term += " " + slug(rng.choice(BRANDS)).split("-")[0]
+    return term
+
+def browse(w):
+    resp = w.get("browse.index", "/")
+    etag = resp.headers.get("ETag")
+    if etag:
+        w.get("browse.revalidate", "/", headers={"If-None-Match": etag})
+    w.follow_next("browse.next", resp)
+
+def search(w):
+    w.get("search", "/?q=" + quote(_term(w.rng)))
+
+def search_ilike(w):
+    # El mismo término por la consulta que usaba index() antes del índice
+    # (ilike '%q%' sin paginar, que en Postgres recorre toda la tabla) y por
+    # search_products() con el backend de --search-backend.
+    from core import supabase
+    from search import search_products
+    term = _term(w.rng)
+    w.rec.call("search.ilike", lambda: supabase.table("products").select("id,name,slug,price,stock,image_path,active")
+               .filter("name", "ilike", f"%{term}%").execute())
+    w.rec.call("search.index", lambda: search_products(term))
+
+def category(w):
+    resp = w.get("category.index", "/?category=" + w.rng.choice(w.ctx.categories)["slug"])
+    w.follow_next("category.next", resp)
+
+def category_sizes(w):
+    from cache import catalog_cache, fragment_cache
+    for size, slug_ in w.ctx.sized_categories:
+        # Se descartan los datos y fragmentos cacheados para medir la consulta.
+        catalog_cache.invalidate("products")
+        fragment_cache.local.invalidate("grid")
+        w.get(f"category.{size}", f"/?category={slug_}")
+
+def cart(w):
+    w.login()
+    w.post("cart.add", "/cart/add", data={"product_id": w.rng.choice(w.ctx.in_stock), "qty": 1})
+    w.get("cart.view", "/cart")
+
+def _legacy_cart(user_id):
+    # Lo que hacían /cart y /checkout antes de cart_with_products: carrito por
+    # user_id, conteo para el encabezado, líneas y luego sus productos con in_(),
+    # con los precios calculados en Python.
+    from app import money
+    from core import db_admin, public_url
+    cid = db_admin().table("carts").select("id").eq("user_id", user_id).maybe_single().execute().data["id"]
+    db_admin().table("cart_items").select("id", count="exact").eq("cart_id", cid).execute()
+    items = db_admin().table("cart_items").select("id,product_id,qty,price_at_add").eq("cart_id", cid).execute().data or []
+    if items:
+        rows = db_admin().table("products").select("id,name,slug,price,image_path,stock").in_("id", [i["product_id"] for i in items]).execute().data or []
+        found = {p["id"]: p for p in rows}
+        for i in items:
+            p = found.get(i["product_id"]) or {}
+            i["product"] = p
+            i["image_url"] = public_url(p.get("image_path"))
+            i["price"] = money(p.get("price") if p else i.get("price_at_add") or 0)
+            i["subtotal"] = money(i["price"] * int(i["qty"] or 1))
+    return items, money(sum(i["subtotal"] for i in items))
+
+def cart_load(w):
+    # Micro-benchmark de la carga del carrito: el camino de 4 llamadas de antes
+    # frente a la RPC cart_with_products, sobre el mismo carrito de 5 líneas.
+    db = w.ctx.db
+    with db.lock:
+        carts = db.tables["carts"].lookup("user_id", w.user_id)
+        if not any(db.tables["cart_items"].lookup("cart_id", cid) for cid in carts):
+            db.rpc_merge_guest_cart(w.user_id, [{"product_id": pid, "qty": 2} for pid in w.rng.sample(w.ctx.in_stock, 5)])
+    app = w.client.application
+
+    def rpc():
+        from app import load_cart
+        with app.test_request_context():
+            load_cart(w.user_id)
+    w.rec.call("cart_load.legacy", lambda: _legacy_cart(w.user_id))
+    w.rec.call("cart_load.rpc", rpc)
+
+def guest(w):
+    # Sesión anónima: navegar y editar el carrito no llama a Supabase; verlo hace una consulta.
+    w.get("guest.index", "/")
+    pids = w.rng.sample(w.ctx.in_stock, 3)
+    for pid in pids:
+        w.post("guest.add", "/cart/add", data={"product_id": pid, "qty": 1})
+    w.post("guest.update", "/cart/update", data={"item_id": pids[0], "qty": 2})
+    w.post("guest.remove", "/cart/remove", data={"item_id": pids[1]})
+    w.get("guest.cart", "/cart")
+    with w.client.session_transaction() as s:
+        items = s.pop("guest_cart", {})
+    app = w.client.application
+
+    # El login pasa por Supabase Auth, que el bench no emula: se mide solo la fusión.
+    def merge():
+        import guest_cart
+        from flask import session
+        with app.test_request_context():
+            session[guest_cart.SESSION_KEY] = items
+            guest_cart.merge(w.user_id)
+    w.rec.call("guest.merge", merge)
+
+def checkout(w):
+    w.login()
+    db = w.ctx.db
+    w.post("checkout.add", "/cart/add", data={"product_id": w.rng.choice(w.ctx.in_stock), "qty": 1})
+    w.get("checkout.view", "/checkout")
+    address_id = min(db.tables["addresses"].lookup("user_id", w.user_id))
+    w.post("checkout.pay", "/checkout/pay", data={"address_id": address_id})
+    with db.lock:
+        order_id = max(db.tables["orders"].lookup("user_id", w.user_id))
+    w.get("checkout.return", f"/payments/pagadito/return-ok?order_id={order_id}")
+
+def orders(w):
+    w.login()
+    w.follow_next("orders.next", w.get("orders.index", "/orders"))
+
+def admin(w):
+    w.login(w.ctx.admin_id)
+    db = w.ctx.db
+    w.get("admin.dashboard", "/admin/dashboard")
+    w.get("admin.products", "/admin/products")
+    pid = w.rng.choice(w.ctx.in_stock)
+    with db.lock:
+        p = dict(db.tables["products"].rows[pid])
+        cats = [l["category_id"] for l in (db.tables["product_categories"].rows[k] for k in db.tables["product_categories"].lookup("product_id", pid))]
+    form = {"name": p["name"], "slug": p["slug"], "description": p["description"] or "", "price": p["price"],
+            "stock": p["stock"] + 1, "active": "on" if p["active"] else "", "categories": cats}
+    w.post("admin.edit", f"/admin/products/{pid}/edit", data=form)
+    w.get("admin.orders", "/admin/orders")
+
+def ipn(w):
+    # Un 20 % son reenvíos de la misma notificación, como hace la pasarela.
+    oid = w.rng.randint(1, len(w.ctx.db.tables["orders"].rows))
+    txid = f"TX{oid}" if w.rng.random() < 0.2 else f"TX{oid}-{w.rng.getrandbits(32)}"
+    w.post("ipn", "/payments/pagadito/ipn", data={"reference": f"ORDER-{oid}", "status": w.rng.choice(("paid", "failed")), "txid": txid})
+
+def export(w):
+    w.login(w.ctx.admin_id)
+    since = (date.today() - timedelta(days=7)).isoformat()
+    w.get("export.csv", f"/admin/orders/export?format=csv&from={since}")
+
+def product_import(w, rows: int = 200):
+    w.login(w.ctx.admin_id)
+    products = w.ctx.db.tables["products"].rows
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    out.writerow(["name", "slug", "description", "price", "stock", "active", "categories"])
+    for _ in range(rows):
+        p = products[w.rng.randint(1, len(products))]
+        out.writerow([p["name"], p["slug"], p["description"], f"{p['price']:.2f}", p["stock"], "1", w.rng.choice(w.ctx.categories)["slug"]])
+    data = {"file": (io.BytesIO(buf.getvalue().encode()), "productos.csv")}
+    w.post("import", "/admin/products/import", data=data, content_type="multipart/form-data")
+
+SCENARIOS = {
+    "browse": browse,
+    "search": search,
+    "search_ilike": search_ilike,
+    "category": category,
+    "category_sizes": category_sizes,
+    "cart": cart,
+    "cart_load": cart_load,
+    "guest": guest,
+    "checkout": checkout,
+    "orders": orders,
+    "admin": admin,
+    "ipn": ipn,
+    "export": export,
+    "import": product_import,
+}
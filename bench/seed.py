@@ -0,0 +1,114 @@
+import re
+import uuid
+import random
+from datetime import datetime, timedelta, timezone
+from bench.fake_supabase import FakeSupabase, _fold
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+NOUNS = ["Arroz", "Frijol", "Leche", "Café", "Azúcar", "Aceite", "Harina", "Pasta", "Atún", "Galletas",
+         "Jabón", "Detergente", "Papel higiénico", "Cereal", "Avena", "Yogur", "Queso", "Jugo", "Refresco",
+         "Agua pura", "Salsa de tomate", "Sopa", "Chocolate", "Mantequilla", "Huevos", "Pan", "Tortillas",
+         "Champú", "Pañales", "Sal", "Consomé", "Mayonesa", "Margarina", "Crema", "Cloro"]
+BRANDS = ["Don Justo", "La Estrella", "Maravilla", "Campestre", "San Miguel", "El Molino", "Dos Pinos",
+          "Ducal", "Malher", "Señorial", "Incaparina", "Rosa Blanca", "Naturas", "Suli", "Kern's"]
+SIZES = ["250 g", "500 g", "1 kg", "2 kg", "1 L", "2 L", "355 ml", "12 unidades", "400 g", "900 g"]
+AISLES = ["Abarrotes", "Lácteos", "Bebidas", "Limpieza", "Higiene", "Desayuno", "Enlatados", "Panadería",
+          "Snacks", "Bebés", "Congelados", "Condimentos"]
+# Categorías de tamaño fijo para medir la navegación por categoría según su volumen.
+SIZED_CATEGORIES = (10, 100, 1_000, 10_000, 50_000)
+STATUSES = [("pending", "unpaid"), ("paid", "paid"), ("paid", "paid"), ("paid", "paid"),
+            ("shipped", "paid"), ("pending", "failed"), ("cancelled", "failed")]
+
+def slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", _fold(text)).strip("-")
+
+def sizes_for(scale: str):
+    n = SCALES[scale]
+    return {
+        "products": n,
+        "categories": min(1000, max(12, n // 1000)),
+        "users": min(50_000, max(50, n // 20)),
+        "orders": n,
+    }
+
+class Seed:
+    def __init__(self, db, users, admin_id, categories, sized_categories):
+        self.db = db
+        self.users = users
+        self.admin_id = admin_id
+        self.categories = categories
+        self.sized_categories = sized_categories
+        self.in_stock = [pid for pid, p in db.tables["products"].rows.items() if p["active"] and p["stock"] >= 1000]
+
+def seed(db: FakeSupabase, scale: str = "1k", seed: int = 1) -> Seed:
+    rng = random.Random(seed)
+    size = sizes_for(scale)
+    created = datetime.now(timezone.utc)
+
+    categories = []
+    for i in range(1, size["categories"] + 1):
+        name = AISLES[(i - 1) % len(AISLES)] + ("" if i <= len(AISLES) else f" {i // len(AISLES) + 1}")
+        categories.append({"id": i, "name": name, "slug": slug(name)})
+    db.load("categories", categories)
+
+    def products():
+        for pid in range(1, size["products"] + 1):
+            brand = rng.choice(BRANDS)
+            name = f"{rng.choice(NOUNS)} {brand} {rng.choice(SIZES)}"
+            yield {
+                "id": pid, "name": name, "slug": f"{slug(name)}-{pid}",
+                "description": f"{name}. Producto de la marca {brand} para el hogar.",
+                "price": round(rng.uniform(3, 250), 2), "stock": rng.choice((0, 5, 25, 100, 1000, 100_000)),
+                "image_path": None, "image_version": None, "image_variants": False,
+                "active": rng.random() > 0.05,
+            }
+    db.load("products", products())
+
+    def links():
+        for pid in range(1, size["products"] + 1):
+            for cid in rng.sample(range(1, size["categories"] + 1), k=min(2, size["categories"])):
+                yield {"product_id": pid, "category_id": cid}
+    db.load("product_categories", links())
+
+    sized = []
+    for i, n in enumerate(n for n in SIZED_CATEGORIES if n <= size["products"]):
+        cid = size["categories"] + 1 + i
+        db.load("categories", [{"id": cid, "name": f"Muestra {n}", "slug": f"muestra-{n}"}])
+        db.load("product_categories", ({"product_id": pid, "category_id": cid} for pid in rng.sample(range(1, size["products"] + 1), n)))
+        sized.append((n, f"muestra-{n}"))
+
+    users = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(size["users"])]
+    admin_id = users[0]
+    db.load("admins", [{"user_id": admin_id}])
+    db.load("addresses", ({
+        "user_id": uid, "full_name": f"Cliente {i}", "phone": "5555-0000", "line1": f"{i} Avenida 1-23",
+        "line2": None, "city": "Guatemala", "region": "Guatemala", "postal_code": "01001",
+        "country": "GT", "is_default": True,
+    } for i, uid in enumerate(users)))
+
+    carts = [{"id": str(uuid.UUID(int=rng.getrandbits(128))), "user_id": uid} for uid in users]
+    db.load("carts", carts)
+    db.load("cart_items", ({
+        "cart_id": cart["id"], "product_id": pid, "qty": rng.randint(1, 3), "price_at_add": None,
+    } for cart in carts for pid in rng.sample(range(1, size["products"] + 1), k=rng.randint(0, 3))))
+
+    products = db.tables["products"].rows
+    orders, items = [], []
+    for oid in range(1, size["orders"] + 1):
+        status, payment = rng.choice(STATUSES)
+        lines = []
+        for pid in rng.sample(range(1, size["products"] + 1), k=min(rng.randint(1, 4), size["products"])):
+            p, qty = products[pid], rng.randint(1, 3)
+            lines.append({"order_id": oid, "product_id": pid, "name": p["name"], "price": p["price"], "qty": qty, "subtotal": round(p["price"] * qty, 2)})
+        items += lines
+        orders.append({
+            "id": oid, "user_id": rng.choice(users), "status": status, "payment_status": payment,
+            "total": round(sum(l["subtotal"] for l in lines), 2), "currency": "GTQ", "payment_method": "pagadito",
+            "gateway_ref": f"TX{oid}" if payment == "paid" else None,
+            "address_snapshot": {"city": "Guatemala", "line1": "1 Avenida"},
+            "created_at": (created - timedelta(minutes=rng.randint(0, 365 * 24 * 60))).isoformat(),
+        })
+    db.load("orders", orders)
+    db.load("order_items", items)
+    return Seed(db, users, admin_id, categories, sized)
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Mide el arranque en frío de cada worker: importar la app, create_app(), los
+# hooks de gunicorn.conf.py (clientes de Supabase y plantillas) y la primera respuesta contra el
+# Supabase en memoria. Cada worker es un proceso nuevo; con --preload un proceso
+# padre importa la app una vez y hace fork de los workers, como gunicorn --preload.
+# Este módulo solo importa la biblioteca estándar para no adelantar importaciones de la app.
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def _load_app():
+    started = time.perf_counter()
+    import app
+    import_ms = _ms(started)
+    started = time.perf_counter()
+    application = app.create_app()
+    return application, import_ms, _ms(started)
+
+def _fake_db(latency_ms):
+    from bench.fake_supabase import FakeSupabase
+    from bench.seed import seed
+    db = FakeSupabase(latency_ms / 1000, 0)
+    seed(db, "1k")
+    return db
+
+def _serve_first(application, db):
+    import core
+    import logging
+    from app import warm_templates
+    application.logger.setLevel(logging.ERROR)
+    inherited = len(core._clients)
+    core._base_transport = db.transport
+    started = time.perf_counter()
+    # Lo mismo que post_worker_init en gunicorn.conf.py.
+    core.init_clients()
+    warm_templates(application)
+    init_ms = _ms(started)
+    client = application.test_client()
+    started = time.perf_counter()
+    status = client.get("/").status_code
+    first_ms = _ms(started)
+    started = time.perf_counter()
+    client.get("/")
+    return {"pid": os.getpid(), "status": status, "inherited_clients": inherited,
+            "worker_init_ms": init_ms, "first_response_ms": first_ms, "warm_response_ms": _ms(started)}
+
+def worker(latency_ms):
+    application, import_ms, create_ms = _load_app()
+    db = _fake_db(latency_ms)
+    result = _serve_first(application, db)
+    result.update(import_ms=import_ms, create_app_ms=create_ms)
+    print(json.dumps(result), flush=True)
+
+def master(workers, latency_ms):
+    application, import_ms, create_ms = _load_app()
+    started = time.perf_counter()
+    # Lo mismo que when_ready en gunicorn.conf.py con preload_app.
+    import supabase  # noqa: F401
+    from app import warm_templates
+    warm_templates(application)
+    preload_ms = _ms(started)
+    db = _fake_db(latency_ms)
+    children = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            result = _serve_first(application, db)
+            # Con preload el worker ya nace con la app importada.
+            result.update(import_ms=0.0, create_app_ms=0.0)
+            os.write(write, json.dumps(result).encode())
+            os._exit(0)
+        os.close(write)
+        children.append((pid, read))
+    for pid, read in children:
+        with os.fdopen(read) as f:
+            print(f.read(), flush=True)
+        os.waitpid(pid, 0)
+    print(json.dumps({"master": True, "import_ms": import_ms, "create_app_ms": create_ms, "preload_ms": preload_ms}), flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de arranque y primera respuesta por worker.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="workers que arrancan a la vez (por defecto, uno por CPU)")
+    parser.add_argument("--preload", action="store_true", help="importa la app en un proceso padre y hace fork de los workers")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latencia inyectada por llamada a Supabase")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", 1500)),
+                        help="máximo por worker desde que arranca hasta su primera respuesta")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--master", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return worker(args.latency_ms)
+    if args.master:
+        return master(args.workers, args.latency_ms)
+
+    from bench.run import bench_env
+    env = {**os.environ, **bench_env()}
+    cmd = [sys.executable, "-m", "bench.startup", "--latency-ms", str(args.latency_ms)]
+    # Los workers arrancan a la vez, como al escalar: compiten por la CPU igual que en producción.
+    if args.preload:
+        procs = [subprocess.Popen(cmd + ["--master", "--workers", str(args.workers)], env=env, stdout=subprocess.PIPE, text=True)]
+    else:
+        procs = [subprocess.Popen(cmd + ["--worker"], env=env, stdout=subprocess.PIPE, text=True) for _ in range(args.workers)]
+    results = []
+    for p in procs:
+        out, _ = p.communicate()
+        if p.returncode:
+            sys.exit(f"un worker terminó con código {p.returncode}")
+        results += [json.loads(line) for line in out.splitlines() if line.strip()]
+
+    master_stats = next((r for r in results if r.get("master")), None)
+    if master_stats:
+        print(f"padre (preload): import {master_stats['import_ms']} ms, create_app {master_stats['create_app_ms']} ms, "
+              f"when_ready {master_stats['preload_ms']} ms")
+    cols = ("import_ms", "create_app_ms", "worker_init_ms", "first_response_ms", "warm_response_ms", "total_ms")
+    print(f"{'worker':<8}" + "".join(f"{c:>19}" for c in cols))
+    over = []
+    for i, r in enumerate(r for r in results if not r.get("master")):
+        if r["status"] >= 500 or r["inherited_clients"]:
+            sys.exit(f"worker {r['pid']}: status {r['status']}, clientes heredados {r['inherited_clients']}")
+        r["total_ms"] = round(r["import_ms"] + r["create_app_ms"] + r["worker_init_ms"] + r["first_response_ms"], 1)
+        print(f"{i:<8}" + "".join(f"{r[c]:>19}" for c in cols))
+        if r["total_ms"] > args.budget_ms:
+            over.append(r["total_ms"])
+    if over:
+        sys.exit(f"{len(over)} workers superaron el presupuesto de {args.budget_ms:.0f} ms: {', '.join(map(str, over))}")
+    print(f"todos los workers dentro del presupuesto de {args.budget_ms:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", 60))
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", 512))
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 256))
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+
+_MISSING = object()
+
+_redis = None
+if CACHE_REDIS_URL:
+    try:
+        import redis
+        _redis = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=0.1, socket_connect_timeout=0.1)
+    except ImportError:
+        _redis = None
+
+class TTLCache:
+    def __init__(self, maxsize: int = 256, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, loader):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def invalidate(self, *namespaces):
+        # Las claves son tuplas cuyo primer elemento es el espacio de nombres.
+        with self._lock:
+            if not namespaces:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if k[0] in namespaces]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+def stamp_shared(key: str, ttl: float):
+    # Marca de tiempo visible para todos los workers cuando hay Redis.
+    if _redis is not None:
+        try:
+            _redis.set(f"stamp:{key}", time.time(), ex=max(1, int(ttl)))
+        except Exception:
+            pass
+
+def shared_stamp(key: str) -> float:
+    if _redis is None:
+        return 0.0
+    try:
+        return float(_redis.get(f"stamp:{key}") or 0)
+    except Exception:
+        return 0.0
+
+catalog_cache = TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+
+def catalog_etag(*parts) -> str:
+    # Se calcula sobre el HTML de los fragmentos: es igual en todos los workers
+    # que sirven lo mismo y cambia solo cuando cambia lo que se ve.
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:24]
+
+def invalidate_products():
+    # "catalog_version" se vuelve a leer de la base: la subió el trigger de la escritura.
+    catalog_cache.invalidate("products", "admin_products", "catalog_version")
+
+def invalidate_categories():
+    # El filtro por categoría del catálogo depende de las categorías.
+    catalog_cache.invalidate("categories", "admin_categories", "products", "catalog_version")
+
+class FragmentCache:
+    def __init__(self, maxsize: int = FRAGMENT_CACHE_SIZE, ttl: float = CATALOG_CACHE_TTL, backend=None):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.backend = backend
+
+    def _backend_key(self, key):
+        return "frag:" + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key):
+        html = self.local.get(key)
+        if html is None and self.backend is not None:
+            try:
+                raw = self.backend.get(self._backend_key(key))
+            except Exception:
+                raw = None
+            if raw is not None:
+                html = raw.decode()
+                self.local.set(key, html)
+        return html
+
+    def set(self, key, html: str):
+        self.local.set(key, html)
+        if self.backend is not None:
+            try:
+                self.backend.set(self._backend_key(key), html.encode(), ex=int(self.local.ttl))
+            except Exception:
+                pass
+
+    def get_or_render(self, key, render):
+        html = self.get(key)
+        if html is None:
+            html = render()
+            self.set(key, html)
+        return html
+
+fragment_cache = FragmentCache(backend=_redis)
@@ -1,10 +1,25 @@
 import os
-from functools import wraps
+import time
+import random
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, lru_cache
+from urllib.parse import quote
+import httpx
 from flask import session, redirect, url_for, flash, request
-from dotenv import load_dotenv, find_dotenv
-from supabase import create_client, Client
+from dotenv import load_dotenv
+from cache import TTLCache, stamp_shared, shared_stamp
+from metrics import InstrumentedTransport
 
-load_dotenv(find_dotenv())
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Ruta fija en lugar de find_dotenv(), que recorre el árbol de directorios en cada arranque.
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY")
@@ -12,33 +27,291 @@ SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 SECRET_KEY = os.environ.get("SECRET_KEY", "change-me")
 BUCKET = "products"
 CURRENCY = os.environ.get("CURRENCY", "GTQ")
+PUBLIC_URL_CACHE_SIZE = int(os.environ.get("PUBLIC_URL_CACHE_SIZE", 4096))
+IMAGE_VARIANTS = {"thumb": 160, "card": 480, "detail": 1024}
+
+SUPABASE_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", 20))
+SUPABASE_KEEPALIVE = float(os.environ.get("SUPABASE_KEEPALIVE", 30))
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", 10))
+SUPABASE_CONNECT_TIMEOUT = float(os.environ.get("SUPABASE_CONNECT_TIMEOUT", 3))
+SUPABASE_STORAGE_TIMEOUT = float(os.environ.get("SUPABASE_STORAGE_TIMEOUT", 30))
+SUPABASE_RETRIES = int(os.environ.get("SUPABASE_RETRIES", 2))
+SUPABASE_BACKOFF = float(os.environ.get("SUPABASE_BACKOFF", 0.2))
+# Tiempo total de una llamada con sus reintentos; por debajo del timeout de gunicorn (30 s).
+SUPABASE_RETRY_BUDGET = float(os.environ.get("SUPABASE_RETRY_BUDGET", 20))
+SUPABASE_HTTP2 = os.environ.get("SUPABASE_HTTP2", "1") == "1" and HTTP2_AVAILABLE
+PARALLEL_WORKERS = int(os.environ.get("PARALLEL_WORKERS", 8))
+ADMIN_CACHE_TTL = float(os.environ.get("ADMIN_CACHE_TTL", 60))
+CART_COUNT_TTL = float(os.environ.get("CART_COUNT_TTL", 300))
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRY_STATUSES = frozenset({502, 503, 504})
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+class RetryTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, retries: int = SUPABASE_RETRIES, backoff: float = SUPABASE_BACKOFF,
+                 budget: float = SUPABASE_RETRY_BUDGET):
+        self._transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.budget = budget
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            retryable = request.method in IDEMPOTENT_METHODS and attempt < self.retries
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            try:
+                response = self._transport.handle_request(request)
+            except RETRY_ERRORS:
+                # Solo se reintenta si la espera cabe en lo que queda del presupuesto.
+                if not retryable or time.monotonic() + delay >= deadline:
+                    raise
+            else:
+                if not retryable or response.status_code not in RETRY_STATUSES or time.monotonic() + delay >= deadline:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+            # Los reintentos no pueden esperar más de lo que queda del presupuesto.
+            remaining = deadline - time.monotonic()
+            timeout = request.extensions.get("timeout") or dict.fromkeys(("connect", "read", "write", "pool"))
+            request.extensions["timeout"] = {k: remaining if v is None else min(v, remaining) for k, v in timeout.items()}
+
+    def close(self):
+        self._transport.close()
+
+@lru_cache(maxsize=1)
+def _ssl_context():
+    # Cargar los certificados cuesta ~40 ms por transporte; se comparte un contexto.
+    return httpx.create_ssl_context()
+
+def _base_transport() -> httpx.BaseTransport:
+    # bench/ lo sustituye por un PostgREST en memoria antes de crear los clientes.
+    return httpx.HTTPTransport(
+        verify=_ssl_context(),
+        http2=SUPABASE_HTTP2,
+        limits=httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE, keepalive_expiry=SUPABASE_KEEPALIVE),
+    )
+
+def _http_client(base_url, headers, timeout: float) -> httpx.Client:
+    transport = _base_transport()
+    return httpx.Client(
+        base_url=base_url,
+        headers=headers,
+        timeout=httpx.Timeout(timeout, connect=SUPABASE_CONNECT_TIMEOUT),
+        transport=InstrumentedTransport(RetryTransport(transport)),
+        follow_redirects=True,
+    )
+
+def _pooled(client):
+    # supabase-py recrea postgrest/storage en cada evento de auth; se envuelven
+    # sus constructores para que siempre usen el transporte configurado.
+    init_postgrest, init_storage = client._init_postgrest_client, client._init_storage_client
+
+    def postgrest_client(**kwargs):
+        pg = init_postgrest(**kwargs)
+        pg.session = _http_client(str(pg.session.base_url), pg.session.headers, SUPABASE_TIMEOUT)
+        return pg
+
+    def storage_client(**kwargs):
+        st = init_storage(**kwargs)
+        st.session = st._client = _http_client(str(st._client.base_url), st._client.headers, SUPABASE_STORAGE_TIMEOUT)
+        return st
+
+    client._init_postgrest_client = postgrest_client
+    client._init_storage_client = storage_client
+    return client
+
+def _create_client(key: str):
+    if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+        raise RuntimeError("Faltan SUPABASE_URL y/o SUPABASE_ANON_KEY.")
+    # supabase-py (postgrest, gotrue, storage, realtime) es la importación más
+    # pesada de la app; se difiere hasta el primer cliente.
+    from supabase import create_client, ClientOptions
+    options = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT, storage_client_timeout=int(SUPABASE_STORAGE_TIMEOUT))
+    return _pooled(create_client(SUPABASE_URL, key, options=options))
+
+# Clientes por proceso, creados en el primer uso. Sin service role el admin usa la clave anon.
+_CLIENT_KEYS = {"anon": SUPABASE_ANON_KEY, "admin": SUPABASE_SERVICE_ROLE_KEY or SUPABASE_ANON_KEY}
+_ADMIN_ROLE = "admin" if SUPABASE_SERVICE_ROLE_KEY else "anon"
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(role: str = "anon"):
+    client = _clients.get(role)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(role)
+            if client is None:
+                client = _clients[role] = _create_client(_CLIENT_KEYS[role])
+    return client
+
+def init_clients():
+    # Para crear los clientes antes de la primera petición (post_worker_init de gunicorn).
+    # supabase-py crea el cliente de PostgREST en el primer acceso; se fuerza aquí.
+    for role in {"anon", _ADMIN_ROLE}:
+        get_client(role).postgrest
+
+class LazyClient:
+    # Permite seguir usando `from core import supabase` sin crear el cliente al importar.
+    def __init__(self, role: str):
+        self._role = role
+
+    def __getattr__(self, name):
+        return getattr(get_client(self._role), name)
 
-if not SUPABASE_URL or not SUPABASE_ANON_KEY:
-    raise RuntimeError("Faltan SUPABASE_URL y/o SUPABASE_ANON_KEY.")
+supabase = LazyClient("anon")
+admin_supabase = LazyClient(_ADMIN_ROLE)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-admin_supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY) if SUPABASE_SERVICE_ROLE_KEY else supabase
+_parallel_pool = None
+_parallel_lock = threading.Lock()
 
-def db_admin() -> Client:
-    return admin_supabase
+def background_pool() -> ThreadPoolExecutor:
+    global _parallel_pool
+    with _parallel_lock:
+        if _parallel_pool is None:
+            _parallel_pool = ThreadPoolExecutor(max_workers=PARALLEL_WORKERS, thread_name_prefix="parallel")
+        return _parallel_pool
+
+def run_parallel(*calls):
+    # Ejecuta consultas independientes a la vez. Con workers gevent los hilos
+    # del pool son greenlets, así que sirve igual en modo gthread y gevent.
+    # Cada tarea corre en una copia del contexto para que sus llamadas a
+    # Supabase se atribuyan a la petición que las lanzó.
+    if len(calls) < 2:
+        return [call() for call in calls]
+    futures = [background_pool().submit(contextvars.copy_context().run, call) for call in calls]
+    return [f.result() for f in futures]
+
+def _reset_after_fork():
+    # Los sockets heredados del proceso padre no se cierran (eso afectaría al
+    # padre); solo se descartan para que el hijo cree sus propios clientes.
+    # Los locks se recrean por si otro hilo del padre los tenía tomados al hacer fork.
+    global _parallel_pool, _parallel_lock, _clients_lock, _admin_stats_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+    _admin_stats_lock = threading.Lock()
+    _parallel_pool = None
+    _parallel_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+STORAGE_PUBLIC_BASE = f"{(SUPABASE_URL or '').rstrip('/')}/storage/v1/object/public/{BUCKET}/"
+
+def db_admin():
+    return get_client(_ADMIN_ROLE)
 
 def storage_admin():
-    return admin_supabase.storage
+    return db_admin().storage
 
-def public_url(path: str | None) -> str | None:
+@lru_cache(maxsize=PUBLIC_URL_CACHE_SIZE)
+def _public_url(path: str, version) -> str:
+    url = STORAGE_PUBLIC_BASE + quote(path.lstrip("/"))
+    return f"{url}?v={version}" if version else url
+
+def public_url(path: str | None, version=None) -> str | None:
     if not path:
         return None
-    data = supabase.storage.from_(BUCKET).get_public_url(path)
-    return data.get("publicUrl")
+    return _public_url(path, version)
+
+def variant_path(path: str, variant: str, ext: str) -> str:
+    return f"{path.rsplit('.', 1)[0]}.{variant}.{ext}"
+
+def image_set(p: dict, variant: str = "card") -> dict:
+    path, version = p.get("image_path"), p.get("image_version")
+    if not path or not p.get("image_variants"):
+        return {"image_url": public_url(path, version), "image_srcset": None, "image_srcset_webp": None}
+    def srcset(ext):
+        return ", ".join(f"{public_url(variant_path(path, v, ext), version)} {w}w" for v, w in IMAGE_VARIANTS.items())
+    return {
+        "image_url": public_url(variant_path(path, variant, "jpg"), version),
+        "image_srcset": srcset("jpg"),
+        "image_srcset_webp": srcset("webp"),
+    }
 
 def current_user():
     return session.get("user")
 
+# El conteo del carrito vive en la sesión firmada junto a cart_id: así lo ve
+# cualquier worker. El TTL solo acota el desfase si el mismo usuario edita el
+# carrito desde otro navegador.
+def session_cart_count():
+    entry = session.get("cart_count")
+    if entry and time.time() - entry[1] < CART_COUNT_TTL:
+        return entry[0]
+    return None
+
+def remember_cart_count(count: int):
+    session["cart_count"] = [max(0, count), time.time()]
+
+admin_cache = TTLCache(maxsize=1024, ttl=ADMIN_CACHE_TTL)
+admin_auth_stats = {"lookups": 0, "cache_hits": 0, "session_hits": 0, "revalidations": 0}
+_admin_stats_lock = threading.Lock()
+_admin_revoked = {}
+_admin_refreshing = set()
+
+def _count_admin_auth(name: str):
+    # Se incrementan desde los hilos de las peticiones y desde background_pool().
+    with _admin_stats_lock:
+        admin_auth_stats[name] += 1
+
+def _lookup_admin(user_id: str) -> bool:
+    _count_admin_auth("lookups")
+    res = db_admin().table("admins").select("user_id").eq("user_id", user_id).limit(1).execute()
+    return bool(res.data)
+
+def _revoked_at(user_id: str) -> float:
+    return max(_admin_revoked.get(user_id, 0), shared_stamp(f"admin_revoked:{user_id}"))
+
+def _revalidate_admin(user_id: str):
+    try:
+        # Se guarda la hora de inicio: una revocación durante la consulta la invalida.
+        started = time.time()
+        admin_cache.set(user_id, (_lookup_admin(user_id), started))
+        _count_admin_auth("revalidations")
+    except Exception:
+        pass
+    finally:
+        _admin_refreshing.discard(user_id)
+
+def _admin_entry(user_id: str) -> tuple[bool, float]:
+    # (es admin, hora en que se consultó la tabla admins).
+    entry = admin_cache.get(user_id)
+    if entry is None:
+        started = time.time()
+        entry = (_lookup_admin(user_id), started)
+        admin_cache.set(user_id, entry)
+        return entry
+    ok, checked_at = entry
+    if checked_at <= _revoked_at(user_id):
+        admin_cache.pop(user_id)
+        return _admin_entry(user_id)
+    _count_admin_auth("cache_hits")
+    # Pasada la mitad del TTL se revalida en segundo plano sin bloquear la petición.
+    if time.time() - checked_at > ADMIN_CACHE_TTL / 2 and user_id not in _admin_refreshing:
+        _admin_refreshing.add(user_id)
+        background_pool().submit(_revalidate_admin, user_id)
+    return entry
+
 def is_admin(user_id: str | None) -> bool:
-    if not user_id:
+    return bool(user_id) and _admin_entry(user_id)[0]
+
+def revoke_admin(user_id: str):
+    # Fuerza a revisar la tabla admins en la próxima petición. Con CACHE_REDIS_URL
+    # la marca llega a todos los workers; sin Redis solo a este proceso y los
+    # demás tardan como mucho ADMIN_CACHE_TTL en enterarse.
+    admin_cache.pop(user_id)
+    _admin_revoked[user_id] = time.time()
+    stamp_shared(f"admin_revoked:{user_id}", ADMIN_CACHE_TTL)
+
+def _session_admin(user_id: str) -> bool:
+    mirror = session.get("admin_ok")
+    if not mirror or mirror.get("uid") != user_id:
         return False
-    res = db_admin().table("admins").select("user_id").eq("user_id", user_id).execute()
-    return len(res.data or []) > 0
+    issued = mirror.get("at", 0)
+    return time.time() - issued < ADMIN_CACHE_TTL and issued > _revoked_at(user_id)
 
 def login_required(f):
     @wraps(f)
@@ -56,8 +329,16 @@ def admin_required(f):
         if not user:
             flash("Debes iniciar sesión.", "warning")
             return redirect(url_for("login", next=request.path))
-        if not is_admin(user.get("id")):
+        uid = user.get("id")
+        if _session_admin(uid):
+            _count_admin_auth("session_hits")
+            return f(*args, **kwargs)
+        ok, checked_at = _admin_entry(uid) if uid else (False, 0)
+        if not ok:
+            session.pop("admin_ok", None)
             flash("No autorizado.", "danger")
             return redirect(url_for("index"))
+        # El espejo vence con la consulta de la que sale, no ADMIN_CACHE_TTL después de ahora.
+        session["admin_ok"] = {"uid": uid, "at": checked_at}
         return f(*args, **kwargs)
     return wrapper
@@ -0,0 +1,63 @@
+import io
+import os
+import csv
+import json
+from core import db_admin
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 500))
+EXPORT_FLUSH_BYTES = 64 * 1024
+ORDER_FIELDS = ["id", "user_id", "created_at", "status", "payment_status", "payment_method", "gateway_ref", "currency", "total"]
+ADDRESS_FIELDS = ["full_name", "phone", "line1", "line2", "city", "region", "postal_code", "country"]
+ITEM_FIELDS = ["product_id", "name", "price", "qty", "subtotal"]
+COLUMNS = [f"order_{f}" for f in ORDER_FIELDS] + [f"address_{f}" for f in ADDRESS_FIELDS] + [f"item_{f}" for f in ITEM_FIELDS]
+
+def iter_orders(date_from=None, date_to=None, status=None, payment_status=None, batch: int = EXPORT_BATCH_SIZE):
+    # Keyset sobre id: cada lote pide solo lo siguiente al último id visto,
+    # así la memoria no depende del tamaño del historial.
+    last_id = 0
+    while True:
+        query = db_admin().table("orders").select(f"{','.join(ORDER_FIELDS)},address_snapshot,order_items({','.join(ITEM_FIELDS)})").gt("id", last_id)
+        if date_from:
+            query = query.gte("created_at", date_from)
+        if date_to:
+            query = query.lt("created_at", date_to)
+        if status:
+            query = query.eq("status", status)
+        if payment_status:
+            query = query.eq("payment_status", payment_status)
+        rows = query.order("id").limit(batch).execute().data or []
+        yield from rows
+        if len(rows) < batch:
+            return
+        last_id = rows[-1]["id"]
+
+def flatten(orders):
+    for order in orders:
+        base = {f"order_{f}": order.get(f) for f in ORDER_FIELDS}
+        addr = order.get("address_snapshot") or {}
+        base.update({f"address_{f}": addr.get(f) for f in ADDRESS_FIELDS})
+        for item in order.get("order_items") or [{}]:
+            yield dict(base, **{f"item_{f}": item.get(f) for f in ITEM_FIELDS})
+
+def csv_stream(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= EXPORT_FLUSH_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def jsonl_stream(rows):
+    chunk, size = [], 0
+    for row in rows:
+        line = json.dumps(row, ensure_ascii=False, default=str) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_FLUSH_BYTES:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    yield "".join(chunk)
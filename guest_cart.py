@@ -0,0 +1,80 @@
+import os
+from flask import session
+from core import supabase, db_admin, remember_cart_count
+
+# Carrito de invitado: vive en la sesión firmada (cookie), así que agregar,
+# actualizar o quitar productos no toca Supabase. Al iniciar sesión se fusiona
+# con el carrito del usuario en una sola llamada (merge_guest_cart).
+GUEST_CART_MAX_ITEMS = int(os.environ.get("GUEST_CART_MAX_ITEMS", 30))
+GUEST_CART_MAX_QTY = int(os.environ.get("GUEST_CART_MAX_QTY", 99))
+SESSION_KEY = "guest_cart"
+PRODUCT_FIELDS = "id,name,slug,price,stock,image_path,image_version,image_variants"
+
+def lines() -> dict:
+    # Las claves de la sesión JSON son texto: {"<product_id>": qty}.
+    return session.get(SESSION_KEY) or {}
+
+def count() -> int:
+    return len(lines())
+
+def _save(items: dict):
+    if items:
+        session[SESSION_KEY] = items
+    else:
+        session.pop(SESSION_KEY, None)
+
+def add(product_id: int, qty: int) -> bool:
+    items = dict(lines())
+    key = str(product_id)
+    if key not in items and len(items) >= GUEST_CART_MAX_ITEMS:
+        return False
+    items[key] = max(1, min(items.get(key, 0) + qty, GUEST_CART_MAX_QTY))
+    _save(items)
+    return True
+
+def update(product_id: int, qty: int):
+    items = dict(lines())
+    key = str(product_id)
+    if key in items:
+        items[key] = max(1, min(qty, GUEST_CART_MAX_QTY))
+        _save(items)
+
+def remove(product_id: int) -> bool:
+    items = dict(lines())
+    removed = items.pop(str(product_id), None) is not None
+    _save(items)
+    return removed
+
+def load() -> dict:
+    # Misma forma que la RPC cart_with_products; el id de la línea es el del producto.
+    items = lines()
+    if not items:
+        return {"items": [], "total": 0}
+    rows = supabase.table("products").select(PRODUCT_FIELDS).in_("id", [int(k) for k in items]).eq("active", True).execute().data or []
+    found = {str(p["id"]): p for p in rows}
+    out = []
+    for key, qty in items.items():
+        p = found.get(key)
+        if not p:
+            continue
+        price = round(float(p.get("price") or 0), 2)
+        out.append({"id": p["id"], "product_id": p["id"], "qty": qty, "price_at_add": None,
+                    "price": price, "subtotal": round(price * qty, 2), "product": p})
+    if len(out) != len(items):
+        # Productos borrados o desactivados desde que se agregaron.
+        _save({str(l["product_id"]): l["qty"] for l in out})
+    return {"items": out, "total": round(sum(l["subtotal"] for l in out), 2)}
+
+def merge(user_id: str):
+    # El carrito de invitado solo se borra de la sesión si la fusión se guardó;
+    # si la RPC falla, sigue ahí para el siguiente intento.
+    items = session.get(SESSION_KEY)
+    if not items:
+        return
+    data = db_admin().rpc("merge_guest_cart", {
+        "p_user_id": user_id,
+        "p_items": [{"product_id": int(k), "qty": qty} for k, qty in items.items()],
+    }).execute().data
+    session.pop(SESSION_KEY, None)
+    session["cart_id"] = data["cart_id"]
+    remember_cart_count(data["count"])
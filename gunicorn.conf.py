@@ -0,0 +1,29 @@
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# gthread: hilos por worker; gevent: greenlets cooperativos (requiere `pip install gevent`).
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+# Con preload el padre importa la app una vez y los workers la heredan al hacer
+# fork; los clientes de Supabase siguen siendo por proceso (ver core._reset_after_fork).
+preload_app = os.environ.get("GUNICORN_PRELOAD", "0") == "1"
+
+def when_ready(server):
+    # Con preload, supabase-py se importa y las plantillas se compilan una vez en
+    # el padre; los workers lo heredan y solo crean sus clientes.
+    if preload_app:
+        import supabase  # noqa: F401
+        from app import warm_templates
+        warm_templates(server.app.wsgi())
+
+def post_worker_init(worker):
+    # Crea los clientes antes de aceptar tráfico para que la primera petición no lo pague.
+    import core
+    from app import warm_templates
+    core.init_clients()
+    warm_templates(worker.wsgi)
@@ -0,0 +1,61 @@
+import io
+import os
+import logging
+import threading
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor
+from core import db_admin, storage_admin, variant_path, BUCKET, IMAGE_VARIANTS
+from cache import invalidate_products
+from search import search_index
+
+# Pillow se importa al generar la primera variante, no al arrancar cada worker.
+PILLOW_AVAILABLE = find_spec("PIL") is not None
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 80))
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+
+log = logging.getLogger(__name__)
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="images")
+        return _executor
+
+def render_variants(data: bytes):
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+    for variant, width in IMAGE_VARIANTS.items():
+        resized = img.copy()
+        resized.thumbnail((width, width), Image.LANCZOS)
+        for ext, (fmt, content_type) in FORMATS.items():
+            buf = io.BytesIO()
+            resized.save(buf, fmt, quality=IMAGE_QUALITY, optimize=True)
+            yield variant, ext, buf.getvalue(), content_type
+
+def build_variants(pid: int, path: str, data: bytes, version: int):
+    bucket = storage_admin().from_(BUCKET)
+    for variant, ext, body, content_type in render_variants(data):
+        bucket.upload(variant_path(path, variant, ext), body,
+                      file_options={"content-type": content_type, "cache-control": "31536000", "x-upsert": "true"})
+    # Si otra subida reemplazó la imagen mientras tanto, no se marca esta versión.
+    rows = db_admin().table("products").update({"image_variants": True}).eq("id", pid).eq("image_version", version).execute().data or []
+    for row in rows:
+        search_index.upsert(row)
+    invalidate_products()
+
+def _run(pid, path, data, version):
+    try:
+        build_variants(pid, path, data, version)
+    except Exception:
+        log.exception("No se pudieron generar las variantes de %s", path)
+
+def schedule_variants(pid: int, path: str, data: bytes, version: int) -> bool:
+    if not PILLOW_AVAILABLE:
+        return False
+    _pool().submit(_run, pid, path, data, version)
+    return True
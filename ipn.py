@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from core import db_admin
+
+IPN_QUEUE_PATH = os.environ.get("IPN_QUEUE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "ipn_queue.sqlite3")
+IPN_WORKERS = int(os.environ.get("IPN_WORKERS", 2))
+IPN_MAX_ATTEMPTS = int(os.environ.get("IPN_MAX_ATTEMPTS", 8))
+IPN_RETRY_BACKOFF = float(os.environ.get("IPN_RETRY_BACKOFF", 2))
+IPN_LEASE = float(os.environ.get("IPN_LEASE", 60))
+IPN_POLL_INTERVAL = float(os.environ.get("IPN_POLL_INTERVAL", 1))
+PAID_STATUSES = {"paid", "approved", "completed", "success"}
+
+SCHEMA = """
+create table if not exists notifications (
+  id integer primary key autoincrement,
+  order_id integer not null,
+  reference text not null,
+  gateway_ref text not null default '',
+  status text not null,
+  received_at real not null,
+  attempts integer not null default 0,
+  next_attempt_at real not null,
+  claimed_until real,
+  done_at real,
+  failed integer not null default 0,
+  last_error text,
+  unique (reference, gateway_ref, status)
+);
+create index if not exists notifications_pending on notifications (done_at, order_id, id);
+"""
+
+log = logging.getLogger(__name__)
+_local = threading.local()
+_wakeup = threading.Event()
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(IPN_QUEUE_PATH), exist_ok=True)
+        conn = sqlite3.connect(IPN_QUEUE_PATH, timeout=30, isolation_level=None)
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=full")
+        conn.executescript(SCHEMA)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def apply_payment(order_id: int, status: str, gateway_ref: str | None = None):
+    # "paid" es terminal: las notificaciones repetidas o atrasadas no lo revierten.
+    if status.lower() in PAID_STATUSES:
+        data = {"status": "paid", "payment_status": "paid"}
+    else:
+        data = {"status": "pending", "payment_status": "failed"}
+    if gateway_ref:
+        data["gateway_ref"] = gateway_ref
+    rows = db_admin().table("orders").update(data).eq("id", order_id).or_("payment_status.is.null,payment_status.neq.paid").execute().data
+    # commit_stock solo toca reservas pendientes, así que repetirlo es inocuo y
+    # cubre el reintento de una notificación cuyo update ya se había aplicado.
+    if data["payment_status"] == "paid":
+        short = db_admin().rpc("commit_stock", {"p_order_id": order_id}).execute().data
+        if short:
+            # La reserva había expirado y ya no hay unidades: pagada, pero pendiente de surtir.
+            log.warning("Orden %s pagada sin stock para %s reservas", order_id, short)
+            db_admin().table("orders").update({"status": "backorder"}).eq("id", order_id).execute()
+    elif rows:
+        db_admin().rpc("release_stock", {"p_order_id": order_id}).execute()
+
+def enqueue(order_id: int, reference: str, status: str, gateway_ref: str | None = None) -> bool:
+    now = time.time()
+    cur = _conn().execute(
+        "insert or ignore into notifications (order_id, reference, gateway_ref, status, received_at, next_attempt_at) values (?, ?, ?, ?, ?, ?)",
+        (order_id, reference, gateway_ref or "", status.lower(), now, now),
+    )
+    ensure_workers()
+    _wakeup.set()
+    return cur.rowcount > 0
+
+def _claim():
+    conn = _conn()
+    now = time.time()
+    conn.execute("begin immediate")
+    try:
+        # Por orden se respeta el orden de llegada: una notificación espera a que
+        # terminen las anteriores de la misma orden.
+        row = conn.execute(
+            """select id, order_id, status, gateway_ref, attempts from notifications n
+               where done_at is null and next_attempt_at <= ? and coalesce(claimed_until, 0) < ?
+                 and not exists (select 1 from notifications o where o.order_id = n.order_id and o.id < n.id and o.done_at is null)
+               order by id limit 1""",
+            (now, now),
+        ).fetchone()
+        if row:
+            conn.execute("update notifications set claimed_until = ? where id = ?", (now + IPN_LEASE, row[0]))
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return row
+
+def process_one() -> bool:
+    row = _claim()
+    if not row:
+        return False
+    nid, order_id, status, gateway_ref, attempts = row
+    conn = _conn()
+    try:
+        apply_payment(order_id, status, gateway_ref)
+    except Exception as e:
+        attempts += 1
+        failed = attempts >= IPN_MAX_ATTEMPTS
+        log.warning("IPN %s de la orden %s falló (intento %s): %s", nid, order_id, attempts, e)
+        conn.execute(
+            "update notifications set attempts = ?, next_attempt_at = ?, claimed_until = null, last_error = ?, failed = ?, done_at = ? where id = ?",
+            (attempts, time.time() + IPN_RETRY_BACKOFF * 2 ** attempts, str(e), int(failed), time.time() if failed else None, nid),
+        )
+    else:
+        conn.execute("update notifications set attempts = ?, done_at = ?, claimed_until = null where id = ?", (attempts + 1, time.time(), nid))
+    return True
+
+def _worker():
+    while True:
+        try:
+            while process_one():
+                pass
+        except Exception:
+            log.exception("Error en el worker de IPN")
+        _wakeup.wait(IPN_POLL_INTERVAL)
+        _wakeup.clear()
+
+def ensure_workers():
+    global _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        for i in range(IPN_WORKERS):
+            threading.Thread(target=_worker, name=f"ipn-{i}", daemon=True).start()
+        _workers_pid = os.getpid()
+
+def queue_stats():
+    row = _conn().execute(
+        "select count(*), sum(done_at is null), sum(failed) from notifications"
+    ).fetchone()
+    return {"total": row[0], "pending": row[1] or 0, "failed": row[2] or 0}
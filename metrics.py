@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from contextvars import ContextVar
+import httpx
+
+SUPABASE_CALL_BUDGET = int(os.environ.get("SUPABASE_CALL_BUDGET", 8))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "bodegona"
+
+_request_calls: ContextVar = ContextVar("supabase_calls", default=None)
+_lock = threading.Lock()
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+_call_totals = {}
+_call_latency = {}
+_request_totals = {}
+_request_latency = {}
+_budget_exceeded = {}
+
+def classify(path: str):
+    parts = [p for p in path.split("/") if p]
+    if parts[:2] == ["rest", "v1"] and len(parts) > 2:
+        if parts[2] == "rpc" and len(parts) > 3:
+            return "postgrest", f"rpc:{parts[3]}"
+        return "postgrest", parts[2]
+    if parts[:2] == ["storage", "v1"]:
+        # /storage/v1/object/<bucket>/... o /storage/v1/object/public/<bucket>/...
+        rest = [p for p in parts[2:] if p not in ("object", "public", "sign")]
+        return "storage", rest[0] if rest else "-"
+    return "other", parts[0] if parts else "-"
+
+def record_call(method: str, path: str, status: int, seconds: float):
+    service, table = classify(path)
+    with _lock:
+        key = (service, table, method, str(status))
+        _call_totals[key] = _call_totals.get(key, 0) + 1
+        _call_latency.setdefault((service, table), Histogram()).observe(seconds)
+    calls = _request_calls.get()
+    if calls is not None:
+        calls.append((service, table, method, seconds))
+
+class InstrumentedTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        status = 0
+        try:
+            response = self._transport.handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            record_call(request.method, request.url.path, status, time.perf_counter() - start)
+
+    def close(self):
+        self._transport.close()
+
+def start_request():
+    _request_calls.set([])
+
+def finish_request(endpoint: str, method: str, status: int, seconds: float):
+    calls = _request_calls.get() or []
+    _request_calls.set(None)
+    with _lock:
+        key = (endpoint, method, str(status))
+        _request_totals[key] = _request_totals.get(key, 0) + 1
+        _request_latency.setdefault(endpoint, Histogram()).observe(seconds)
+        if len(calls) > SUPABASE_CALL_BUDGET:
+            _budget_exceeded[endpoint] = _budget_exceeded.get(endpoint, 0) + 1
+    return calls
+
+def server_timing(calls, seconds: float) -> str:
+    parts = []
+    for service in ("postgrest", "storage"):
+        durations = [c[3] for c in calls if c[0] == service]
+        if durations:
+            parts.append(f'{service};dur={sum(durations) * 1000:.1f};desc="{len(durations)} llamadas"')
+    parts.append(f"total;dur={seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+def summarize(calls) -> str:
+    counts = {}
+    for service, table, method, _ in calls:
+        key = f"{method} {table}"
+        counts[key] = counts.get(key, 0) + 1
+    return ", ".join(f"{k}×{n}" for k, n in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in labels.items()) + "}"
+
+def _histogram_lines(name, hist, **labels):
+    # observe() ya cuenta cada valor en todos los buckets que lo cubren (acumulado).
+    for bound, n in zip(LATENCY_BUCKETS, hist.buckets):
+        yield f"{name}_bucket{_labels(**labels, le=bound)} {n}"
+    yield f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}"
+    yield f"{name}_sum{_labels(**labels)} {hist.sum:.6f}"
+    yield f"{name}_count{_labels(**labels)} {hist.count}"
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        lines += [f"# HELP {PREFIX}_supabase_calls_total Llamadas HTTP a PostgREST/Storage.", f"# TYPE {PREFIX}_supabase_calls_total counter"]
+        for (service, table, method, status), n in sorted(_call_totals.items()):
+            lines.append(f"{PREFIX}_supabase_calls_total{_labels(service=service, table=table, method=method, status=status)} {n}")
+        lines += [f"# HELP {PREFIX}_supabase_call_duration_seconds Latencia de las llamadas a Supabase.", f"# TYPE {PREFIX}_supabase_call_duration_seconds histogram"]
+        for (service, table), hist in sorted(_call_latency.items()):
+            lines += _histogram_lines(f"{PREFIX}_supabase_call_duration_seconds", hist, service=service, table=table)
+        lines += [f"# HELP {PREFIX}_http_requests_total Peticiones atendidas.", f"# TYPE {PREFIX}_http_requests_total counter"]
+        for (endpoint, method, status), n in sorted(_request_totals.items()):
+            lines.append(f"{PREFIX}_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {n}")
+        lines += [f"# HELP {PREFIX}_http_request_duration_seconds Duración de las peticiones.", f"# TYPE {PREFIX}_http_request_duration_seconds histogram"]
+        for endpoint, hist in sorted(_request_latency.items()):
+            lines += _histogram_lines(f"{PREFIX}_http_request_duration_seconds", hist, endpoint=endpoint)
+        lines += [f"# HELP {PREFIX}_supabase_budget_exceeded_total Peticiones que superaron SUPABASE_CALL_BUDGET.", f"# TYPE {PREFIX}_supabase_budget_exceeded_total counter"]
+        for endpoint, n in sorted(_budget_exceeded.items()):
+            lines.append(f"{PREFIX}_supabase_budget_exceeded_total{_labels(endpoint=endpoint)} {n}")
+    return "\n".join(lines) + "\n"
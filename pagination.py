@@ -0,0 +1,121 @@
+import os
+import json
+import math
+import base64
+
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 24))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+# Tipo de cada columna usada como clave de keyset; el resto son texto.
+KEY_TYPES = {"id": int}
+# El offset llega a search_products(off int): más allá de un int de Postgres es un 500.
+MAX_OFFSET = 2**31 - 1
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def page_size(value, default: int = PAGE_SIZE) -> int:
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(n, MAX_PAGE_SIZE))
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None):
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not values:
+        return None
+    # Solo escalares: un cursor manipulado no debe llegar como filtro a PostgREST.
+    if any(isinstance(v, bool) or not isinstance(v, (str, int, float)) for v in values):
+        return None
+    # json.loads acepta Infinity, NaN y 1e400 (que también es inf).
+    if any(isinstance(v, float) and not math.isfinite(v) for v in values):
+        return None
+    return values
+
+def _matches_keys(cursor, keys) -> bool:
+    if len(cursor) != len(keys):
+        return False
+    for key, value in zip(keys, cursor):
+        expected = KEY_TYPES.get(key, str)
+        if not isinstance(value, expected):
+            return False
+        # Las columnas enteras son bigint: un id fuera de rango es un 400 de PostgREST.
+        if expected is int and not -2**63 <= value < 2**63:
+            return False
+    return True
+
+def page_args(args, **cursor):
+    out = {k: v for k, v in args.items() if k not in ("after", "before")}
+    out.update({k: v for k, v in cursor.items() if v})
+    return out
+
+def _literal(value):
+    if isinstance(value, str):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return str(value)
+
+def _keyset_filter(keys, values, op):
+    # (k1 > v1) or (k1 = v1 and k2 > v2) or ...
+    clauses = []
+    for i, key in enumerate(keys):
+        conds = [f"{k}.eq.{_literal(v)}" for k, v in zip(keys[:i], values[:i])]
+        conds.append(f"{key}.{op}.{_literal(values[i])}")
+        clauses.append(conds[0] if len(conds) == 1 else f"and({','.join(conds)})")
+    return ",".join(clauses)
+
+def keyset_page(query, keys, after=None, before=None, limit: int = PAGE_SIZE, desc: bool = False):
+    cursor = decode_cursor(before) or decode_cursor(after)
+    if cursor is not None and not _matches_keys(cursor, keys):
+        cursor = None
+    backwards = cursor is not None and decode_cursor(before) is not None
+    ascending = desc == backwards
+    op = "gt" if ascending else "lt"
+    if cursor is not None:
+        if len(keys) == 1:
+            query = query.filter(keys[0], op, cursor[0])
+        else:
+            query = query.or_(_keyset_filter(keys, cursor, op))
+    for key in keys:
+        query = query.order(key, desc=not ascending)
+    rows = query.limit(limit + 1).execute().data or []
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    has_next = True if backwards else more
+    has_prev = more if backwards else cursor is not None
+    return Page(
+        rows,
+        next_cursor=encode_cursor([rows[-1][k] for k in keys]) if rows and has_next else None,
+        prev_cursor=encode_cursor([rows[0][k] for k in keys]) if rows and has_prev else None,
+    )
+
+def offset_page(fetch, after=None, before=None, limit: int = PAGE_SIZE):
+    cursor = decode_cursor(before) or decode_cursor(after)
+    offset = min(max(0, cursor[0]), MAX_OFFSET) if cursor and isinstance(cursor[0], int) else 0
+    items, total = fetch(offset, limit)
+    return Page(
+        items,
+        next_cursor=encode_cursor([offset + limit]) if offset + limit < total else None,
+        prev_cursor=encode_cursor([max(0, offset - limit)]) if offset > 0 else None,
+        total=total,
+    )
@@ -0,0 +1,127 @@
+import io
+import os
+import re
+import csv
+import time
+import logging
+from decimal import Decimal, InvalidOperation
+from core import db_admin
+from search import fold
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+MAX_REPORTED_ERRORS = 200
+MAX_PRICE = Decimal("100000000")
+SLUG_RE = re.compile(r"^[a-z0-9]+(?:-[a-z0-9]+)*$")
+TRUE_VALUES = {"1", "true", "si", "yes", "y", "x", "on", "activo"}
+
+log = logging.getLogger(__name__)
+
+def slugify(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", fold(text)).strip("-")
+
+def parse_row(row: dict):
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ValueError("falta el nombre")
+    slug = (row.get("slug") or "").strip().lower() or slugify(name)
+    if not SLUG_RE.match(slug):
+        raise ValueError(f"slug inválido: {slug!r}")
+    try:
+        price = Decimal((row.get("price") or "0").strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"precio inválido: {row.get('price')!r}")
+    if not price.is_finite() or not 0 <= price < MAX_PRICE:
+        raise ValueError(f"precio inválido: {row.get('price')!r}")
+    try:
+        stock = int((row.get("stock") or "0").strip())
+    except ValueError:
+        raise ValueError(f"stock inválido: {row.get('stock')!r}")
+    if stock < 0:
+        raise ValueError(f"stock inválido: {stock}")
+    active = (row.get("active") or "").strip()
+    data = {
+        "name": name,
+        "slug": slug,
+        "description": (row.get("description") or "").strip() or None,
+        "price": float(price.quantize(Decimal("0.01"))),
+        "stock": stock,
+        "active": fold(active) in TRUE_VALUES if active else True,
+    }
+    categories = [c.strip().lower() for c in re.split(r"[|;]", row.get("categories") or "") if c.strip()]
+    return data, categories
+
+class ImportReport:
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.valid = 0
+        self.upserted = 0
+        self.linked = 0
+        self.batches = 0
+        self.errors = []
+        self.error_count = 0
+        self.failure = None
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+def _flush(batch, cat_ids, report):
+    report.batches += 1
+    if not report.dry_run:
+        rows = db_admin().table("products").upsert([data for data, _ in batch], on_conflict="slug").execute().data or []
+        # Se cuenta antes de las categorías: si estas fallan, los productos ya están guardados.
+        report.upserted += len(rows)
+        ids = {r["slug"]: r["id"] for r in rows}
+        links = [{"product_id": ids[data["slug"]], "category_id": cat_ids[c]}
+                 for data, cats in batch if data["slug"] in ids for c in cats]
+        if links:
+            db_admin().table("product_categories").upsert(links, on_conflict="product_id,category_id", ignore_duplicates=True).execute()
+        report.linked += len(links)
+    log.info("Importación: lote %s, %s filas leídas, %s válidas, %s errores", report.batches, report.rows, report.valid, report.error_count)
+
+def run_import(stream, dry_run: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    report = ImportReport(dry_run)
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    batch, seen = [], set()
+    try:
+        cat_ids = {c["slug"]: c["id"] for c in db_admin().table("categories").select("id,slug").execute().data or []}
+        reader.fieldnames = [(f or "").strip().lower() for f in reader.fieldnames or []]
+        if "name" not in reader.fieldnames:
+            report.error(1, "el CSV debe tener al menos la columna 'name'")
+            return report
+        for line, row in enumerate(reader, start=2):
+            report.rows += 1
+            try:
+                data, cats = parse_row(row)
+            except ValueError as e:
+                report.error(line, str(e))
+                continue
+            # Un mismo slug dos veces en un lote rompe el upsert en Postgres.
+            if data["slug"] in seen:
+                report.error(line, f"slug repetido en el archivo: {data['slug']}")
+                continue
+            seen.add(data["slug"])
+            unknown = [c for c in cats if c not in cat_ids]
+            if unknown:
+                report.error(line, f"categorías desconocidas: {', '.join(unknown)}")
+            batch.append((data, [c for c in cats if c in cat_ids]))
+            report.valid += 1
+            if len(batch) >= batch_size:
+                _flush(batch, cat_ids, report)
+                batch = []
+        if batch:
+            _flush(batch, cat_ids, report)
+    except Exception as e:
+        # Los lotes ya guardados se quedan; el informe muestra hasta dónde llegó.
+        log.exception("Importación interrumpida tras %s filas", report.rows)
+        report.failure = f"La importación se interrumpió tras {report.rows} filas: {e}"
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,174 @@
+import os
+import re
+import math
+import time
+import threading
+import unicodedata
+from bisect import bisect_left
+from core import supabase
+from cache import catalog_cache
+
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "memory")
+SEARCH_INDEX_TTL = float(os.environ.get("SEARCH_INDEX_TTL", 300))
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 24))
+INDEX_FIELDS = "id,name,slug,description,price,stock,image_path,image_version,image_variants,active"
+FETCH_CHUNK = 1000
+
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+PREFIX_FACTOR = 0.5
+
+STOPWORDS = {"a", "al", "con", "de", "del", "el", "en", "la", "las", "lo", "los", "para", "por", "un", "una", "y"}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text: str | None) -> list[str]:
+    return _TOKEN_RE.findall(fold(text or ""))
+
+class SearchIndex:
+    def __init__(self):
+        self.built_at = 0.0
+        self.stale = False
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._doc_terms = {}
+        self._postings = {}
+        self._vocab = []
+        self._vocab_dirty = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def build(self, rows):
+        with self._lock:
+            self._docs.clear()
+            self._doc_terms.clear()
+            self._postings.clear()
+            for row in rows:
+                self._add(row)
+            self._vocab_dirty = True
+            self.built_at = time.monotonic()
+            self.stale = False
+
+    def upsert(self, row):
+        with self._lock:
+            self._remove(row["id"])
+            self._add(row)
+            self._vocab_dirty = True
+
+    def remove(self, pid):
+        with self._lock:
+            self._remove(pid)
+            self._vocab_dirty = True
+
+    def _add(self, row):
+        if not row.get("active", True):
+            return
+        pid = row["id"]
+        weights = {}
+        for term in tokenize(row.get("name")):
+            weights[term] = weights.get(term, 0.0) + NAME_WEIGHT
+        for term in tokenize(row.get("description")):
+            weights[term] = weights.get(term, 0.0) + DESCRIPTION_WEIGHT
+        self._docs[pid] = {k: v for k, v in row.items() if k != "description"}
+        self._doc_terms[pid] = weights
+        for term, w in weights.items():
+            self._postings.setdefault(term, {})[pid] = w
+
+    def _remove(self, pid):
+        self._docs.pop(pid, None)
+        for term in self._doc_terms.pop(pid, {}):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(pid, None)
+                if not posting:
+                    del self._postings[term]
+
+    def _terms_with_prefix(self, prefix):
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+        i = bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            yield self._vocab[i]
+            i += 1
+
+    def search(self, q: str, ids=None):
+        terms = tokenize(q)
+        if len(terms) > 1:
+            terms = [t for t in terms if t not in STOPWORDS] or terms
+        if not terms:
+            return []
+        with self._lock:
+            n = len(self._docs) or 1
+            scores = None
+            for term in dict.fromkeys(terms):
+                term_scores = {}
+                for match in self._terms_with_prefix(term):
+                    posting = self._postings[match]
+                    idf = math.log(1 + n / len(posting))
+                    factor = 1.0 if match == term else PREFIX_FACTOR
+                    for pid, w in posting.items():
+                        s = w * idf * factor
+                        if s > term_scores.get(pid, 0.0):
+                            term_scores[pid] = s
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pid: s + term_scores[pid] for pid, s in scores.items() if pid in term_scores}
+                if not scores:
+                    return []
+            if ids is not None:
+                scores = {pid: s for pid, s in scores.items() if pid in ids}
+            ranked = sorted(scores, key=lambda pid: (-scores[pid], self._docs[pid].get("name") or ""))
+            return [self._docs[pid] for pid in ranked]
+
+search_index = SearchIndex()
+
+def _fetch_all_products():
+    rows, start = [], 0
+    while True:
+        chunk = supabase.table("products").select(INDEX_FIELDS).order("id").range(start, start + FETCH_CHUNK - 1).execute().data or []
+        rows.extend(chunk)
+        if len(chunk) < FETCH_CHUNK:
+            return rows
+        start += FETCH_CHUNK
+
+def _stale():
+    return search_index.stale or not search_index.built_at or time.monotonic() - search_index.built_at > SEARCH_INDEX_TTL
+
+def invalidate_index():
+    search_index.stale = True
+
+_build_lock = threading.Lock()
+
+def ensure_index():
+    if _stale():
+        # Mientras otro hilo reconstruye, se sirve el índice anterior si ya existe.
+        if _build_lock.acquire(blocking=not search_index.built_at):
+            try:
+                if _stale():
+                    search_index.build(_fetch_all_products())
+            finally:
+                _build_lock.release()
+    return search_index
+
+def category_product_ids(slug: str):
+    def load():
+        cat_row = getattr(supabase.table("categories").select("id").eq("slug", slug).maybe_single().execute(), "data", None)
+        if not cat_row:
+            return frozenset()
+        rows = supabase.table("product_categories").select("product_id").eq("category_id", cat_row["id"]).execute().data or []
+        return frozenset(r["product_id"] for r in rows)
+    return catalog_cache.get_or_set(("products", "category_ids", slug), load)
+
+def search_products(q: str, category: str | None = None, offset: int = 0, limit: int = SEARCH_PAGE_SIZE):
+    if SEARCH_BACKEND == "postgres":
+        res = supabase.rpc("search_products", {"q": q, "category_slug": category, "lim": limit, "off": offset}).execute().data or {}
+        return res.get("items") or [], res.get("total") or 0
+    ids = category_product_ids(category) if category else None
+    hits = ensure_index().search(q, ids)
+    return hits[offset:offset + limit], len(hits)